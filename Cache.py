@@ -0,0 +1,45 @@
+#!/usr/bin/python
+#
+# this is a subroutine for the result caches of the NIFTI tools, shared by
+# fdt_paths_analyze and MIST_ROI_measures: a cached result of a file stays
+# valid while the file has the same size and mtime, or, if the mtime changed
+# (or is not trusted), the same content hash (sha1)
+#
+import os
+import hashlib
+
+
+#sha1 of a file, read in 1MB blocks
+def FileHash(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''): sha1.update(block)
+    return sha1.hexdigest()
+
+
+#checks a cache entry (size, mtime and sha1 of the file when it was cached,
+#sha1 may be None) against filename: the size must match, and the mtime or
+#else the sha1 (always the sha1 with hashed=True); sha1 is the content hash
+#if already known, stat the os.stat of the file; returns (valid, sha1) with
+#sha1 computed here if it was needed (None otherwise), entries missing a
+#field are not valid
+def CacheValid(filename, entry, hashed=False, sha1=None, stat=None):
+    if stat is None: stat = os.stat(filename)
+    if not NeedsHash(entry, stat, hashed):
+        try: return int(entry['size'])==stat.st_size and float(entry['mtime'])==stat.st_mtime and not hashed, sha1
+        except KeyError: return False, sha1
+    if sha1 is None: sha1 = FileHash(filename)
+    return str(entry['sha1'])==sha1, sha1
+
+
+#True if CacheValid decides on the content hash (e.g. to hash these files
+#in parallel first): same size, changed mtime (or hashed=True) and a sha1
+def NeedsHash(entry, stat, hashed=False):
+    try: return int(entry['size'])==stat.st_size and (hashed or float(entry['mtime'])!=stat.st_mtime) and entry['sha1'] is not None
+    except KeyError: return False
+
+
+#example usage
+#
+#from Cache import CacheValid
+#valid, sha1 = CacheValid('fdt_paths.nii.gz', {'size':..., 'mtime':..., 'sha1':...})
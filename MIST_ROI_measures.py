@@ -8,6 +8,16 @@
 # Version 0.1 - 08, October 2020
 #       - 1st public github Release
 #
+# Version 0.2 - 18, October 2026
+#       - headless cohort mode: all subject folders below a root directory
+#         on a process pool, one long or wide cohort table
+#       - voxels counted on the native data type (no float32 cast)
+#       - cohort results cached in a JSON-lines file next to the table,
+#         only new or changed masks are measured again
+#       - Label file input (-l): all structure volumes from one np.bincount,
+#         names from an optional lookup table (-t)
+#       - NIFTI files read with the shared loader (ReadNIFTI.py)
+#
 # ----- LICENSE -----                 
 #
 #    This program is free software: you can redistribute it and/or modify
@@ -40,108 +50,345 @@ except: pass #silent
 from math import floor
 import sys
 import os
+import json
+import argparse
+import multiprocessing
 import numpy as np
-import nibabel as nib
+from SantitizeMask import SantitizeMask, IsCleanMask
+from ReadNIFTI import LoadNIFTI
+from Cache import FileHash, CacheValid, NeedsHash
 import fnmatch
+import glob
+
+
+#sorted names of the files matching "mist_*_mask.nii.gz" in folder
+def MaskFiles(folder):
+    files = os.listdir(folder)
+    filenames = []
+    for name in files: 
+      if fnmatch.fnmatch(name, "mist_*_mask.nii.gz"):
+         filenames.append(name)
+    filenames.sort()
+    return filenames
+
+
+#structure name from a "mist_*_mask.nii.gz" filename
+def StructureName(filename):
+    return filename[5:].replace("_mask.nii.gz"," ").replace("_"," ").title()
+
+
+#voxel count and volume of a Mask file, the volume converted from mm^3 to ml
+def MaskVolume(FIDfile):
+    nvoxels, voxelsize = MaskVoxels(FIDfile)
+    volume = nvoxels * voxelsize /1000 # in mm^3   
+    return nvoxels, volume
+
+
+#voxel count and voxel size (mm^3) of a Mask file, clean masks are counted
+#on the native data type, others are sanitized (as float32) first
+def MaskVoxels(FIDfile):
+    img, data = LoadNIFTI(FIDfile)
+    if IsCleanMask(data): nvoxels = int(np.count_nonzero(data))
+    else:
+        data = SantitizeMask (data.astype(np.float32))
+        nvoxels = int(np.count_nonzero(data>0))
+    SpatResol = np.asarray(img.header.get_zooms())    
+    return nvoxels, np.prod(SpatResol)
+
+
+#process pool worker, errors are returned instead of raised,
+#job is the file and whether its content hash is needed
+def MaskVolume_worker(job):
+    FIDfile, hashed = job
+    try:
+        nvoxels, voxelsize = MaskVoxels(FIDfile); error = None
+        sha1 = FileHash(FIDfile) if hashed else None
+    except Exception as err: nvoxels = 0; voxelsize = 0; sha1 = None; error = str(err)
+    return FIDfile, nvoxels, voxelsize, sha1, error
+
+
+#process pool worker for the content hash of a file
+def FileHash_worker(FIDfile):
+    try: return FileHash(FIDfile)
+    except (IOError, OSError): return None
+
+
+#results of former runs (one JSON object per line, the last one of a path counts)
+def ReadCache(cachefile):
+    cache = {}
+    if not os.path.isfile(cachefile): return cache
+    with open(cachefile) as f:
+        for line in f:
+            try: entry = json.loads(line)
+            except ValueError: continue # e.g. a line cut by an interrupted run
+            cache[entry['path']] = entry
+    return cache
+
+
+#the files whose cached results (entries with the field key) are still valid,
+#the content hashes that decide are computed on the pool; files only touched
+#get their new mtime in the cache
+def ValidCache(FIDfiles, cache, stats, hashed, pool, key):
+    tohash = [f for f in FIDfiles if f in cache and key in cache[f] and NeedsHash(cache[f], stats[f], hashed)]
+    hashes = dict(zip(tohash, pool.imap(FileHash_worker, tohash, chunksize=8)))
+    valid = set()
+    for f in FIDfiles:
+        if f not in cache or key not in cache[f] or (f in hashes and hashes[f] is None): continue # not cached, or unreadable
+        ok, sha1 = CacheValid(f, cache[f], hashed, hashes.get(f), stats[f])
+        if ok: valid.add(f); cache[f]['mtime'] = stats[f].st_mtime
+    return valid
+
+
+#rewrites the cache with the entries of this run
+def WriteCache(cachefile, cache):
+    with open(cachefile+'.tmp', "w") as f:
+        for path in sorted(cache): f.write(json.dumps(cache[path])+'\n')
+    os.replace(cachefile+'.tmp', cachefile)
 
-TK_installed=True
-try: from tkFileDialog import askopenfilename # Python 2
-except: 
-    try: from tkinter.filedialog import askopenfilename; # Python3
-    except: TK_installed=False
-try: from tkFileDialog import askdirectory # Python 2
-except: 
-    try: from tkinter.filedialog import askdirectory; # Python3
-    except: TK_installed=False
-try: import Tkinter as tk; # Python2
-except: 
-    try: import tkinter as tk; # Python3
-    except: TK_installed=False
-if not TK_installed:
-    print ('ERROR: tkinter not installed')
-    print ('       on Linux try "yum install tkinter"')
-    print ('       on MacOS install ActiveTcl from:')
-    print ('       http://www.activestate.com/activetcl/downloads')
-    sys.exit(2)
-
-
-#sanity check/correct Mask data
-def SantitizeMask (data):
-   if not np.array_equal(np.unique(data), np.asarray([0,1])):
-      if np.unique(data).shape[0]!=2: # more than two values present
-         data[data<0] = 0
-         thresh = np.average (data[data>0])        
-         print ("Warning: Mask contains more then two different values, trying to fix")
-         data[data<=thresh]=0; data[data>thresh]=1          
-      else: # only two values present, easily corrected  
-         print ("Warning: Mask contains values!=[0,1], trying to fix")
-         data[data==np.min(np.unique(data))]=0; data[data==np.max(np.unique(data))]=1 
-   return data
+
+#label value -> structure name from a lookup table, one label per line:
+#value and name separated by comma, tab or spaces (FSL/FreeSurfer LUT, or the
+#Label_overlap.csv of NIFTI_Masks2Label), other lines (headers) are skipped
+def ReadLUT(filename):
+    lut = {}
+    with open(filename) as f:
+        for line in f:
+            fields = line.replace(',',' ').split()
+            if len(fields)<2: continue
+            try: label = int(fields[0])
+            except ValueError: continue
+            name = fields[1]
+            if fnmatch.fnmatch(name, "mist_*_mask.nii.gz"): name = StructureName(name)
+            lut[label] = name
+    return lut
+
+
+#voxel counts of all labels (>0) of a Label file from one np.bincount;
+#returns labels, voxel counts, voxel size (mm^3) and warnings
+def LabelVoxels(FIDfile):
+    img, data = LoadNIFTI(FIDfile)
+    if len(data.shape) != 3: raise ValueError('Input is not a 3D NIFTI file')
+    messages = []
+    if data.dtype.kind not in 'iu':
+       messages.append('Warning: Label file is not Integer, converting, please check results carefully')
+       data = np.round(data).astype(np.int32)
+    data = data.ravel()
+    if data.shape[0]>0 and np.min(data)<0: data = data[data>0]
+    counts = np.bincount(data.astype(np.intp))
+    labels = np.flatnonzero(counts[1:])+1
+    SpatResol = np.asarray(img.header.get_zooms())    
+    return labels, counts[labels], np.prod(SpatResol), messages
+
+
+#process pool worker, errors are returned instead of raised,
+#job is the file and whether its content hash is needed
+def LabelVoxels_worker(job):
+    FIDfile, hashed = job
+    try:
+        result = LabelVoxels(FIDfile)
+        return FIDfile, result, FileHash(FIDfile) if hashed else None, None
+    except Exception as err: return FIDfile, None, None, str(err)
+
+
+#writes the cohort table, rows of (subject, structure name, voxel count, volume),
+#long: one line per row, wide: one line per subject with the volumes in ml
+def WriteCohort(filename, table, format, first='Subject'):
+    out = open(filename, "w")
+    if format=='long':
+        out.write (first+'\tStructure name\tVoxel count\tVolume[ml]\n')
+        for subject, structure_name, nvoxels, volume in table:
+            out.write (subject+'\t'+structure_name+'\t'+str(nvoxels)+'\t'+str(volume)+'\n')
+    else:
+        structures = sorted(set([row[1] for row in table]))
+        volumes = {}
+        for subject, structure_name, nvoxels, volume in table: volumes.setdefault(subject, {})[structure_name] = volume
+        out.write (first+'\t'+'\t'.join([name.strip()+' [ml]' for name in structures])+'\n')
+        for subject in sorted(volumes):
+            out.write (subject+'\t'+'\t'.join([str(volumes[subject].get(name,'')) for name in structures])+'\n')
+    out.close()
+
+
+#headless Label file mode: the volumes of all structures of each Label file
+#(e.g. from NIFTI_Masks2Label) from one decoded volume instead of one Mask file each,
+#cached as in the cohort mode (voxel counts of all labels per file)
+def LabelBatch (args):
+    lut = {}
+    if args.lut is not None: lut = ReadLUT(args.lut)
+    FIDfiles = []
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern))
+        if len(matches)==0: print ('ERROR: No input file matching '+pattern); sys.exit(2)
+        FIDfiles.extend([os.path.abspath(f) for f in matches])
+    cachefile = os.path.splitext(args.output)[0]+'_cache.jsonl'
+    cache = {}
+    if not args.no_cache: cache = ReadCache(cachefile)
+    stats = dict([(FIDfile, os.stat(FIDfile)) for FIDfile in FIDfiles])
+    nerrors = 0
+    pool = multiprocessing.Pool(processes=max(1,min(args.jobs,len(FIDfiles))))
+    try:
+        valid = ValidCache(FIDfiles, cache, stats, args.hash, pool, 'labels')
+        todo = [f for f in FIDfiles if f not in valid]
+        for FIDfile, result, sha1, error in pool.imap(LabelVoxels_worker, [(f, args.hash) for f in todo]):
+            if error is not None: print ('ERROR: '+FIDfile+': '+error); nerrors+=1; cache.pop(FIDfile, None); continue
+            labels, counts, voxelsize, messages = result
+            cache[FIDfile] = {'path':FIDfile, 'size':stats[FIDfile].st_size, 'mtime':stats[FIDfile].st_mtime, 'sha1':sha1,
+                              'labels':labels.tolist(), 'counts':counts.tolist(), 'voxelsize':float(voxelsize), 'messages':messages}
+    finally:
+        pool.close(); pool.join()
+    table = []
+    for FIDfile in FIDfiles:
+        if FIDfile not in cache: continue # failed
+        entry = cache[FIDfile]
+        for msg in entry['messages']: print (msg+' ('+FIDfile+')')
+        for label, nvoxels in zip(entry['labels'], entry['counts']):
+            volume = nvoxels * np.float32(entry['voxelsize']) /1000 # in mm^3, as MaskVolume
+            table.append((FIDfile, lut.get(label, 'Label '+str(label)), nvoxels, volume))
+    if not args.no_cache: WriteCache(cachefile, dict([(f, cache[f]) for f in FIDfiles if f in cache]))
+    WriteCohort(args.output, table, args.format, first='File')
+    print ("done, "+str(len(FIDfiles)-nerrors)+" of "+str(len(FIDfiles))+" Label files ("+
+           str(len(todo))+" measured, "+str(len(valid))+" cached), table in "+args.output+"\n")
+    if nerrors>0: sys.exit(1)
+
+
+#headless cohort mode: the MIST subject folders are all folders below the
+#root directories containing "mist_*_mask.nii.gz" files, processed on a pool;
+#results are cached by path, size and mtime (and sha1 with --hash, which also
+#keeps them valid if only the mtime changed), only new or changed masks are
+#measured again
+def batch (argv):
+    parser = argparse.ArgumentParser(prog=Program_name, description='Volumes of the MIST ROIs of all subject folders below root directories, or of all regions of Label files')
+    parser.add_argument('inputs', nargs='+', help='root directories, searched recursively for MIST subject folders (with -l: Label files or glob patterns)')
+    parser.add_argument('-o', '--output', default='MIST_ROI_cohort.csv',
+                        help='cohort table, tab separated (default: %(default)s)')
+    parser.add_argument('-f', '--format', choices=['long','wide'], default='long',
+                        help='long: one line per subject and structure, wide: one line per subject with the volumes in ml (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of files processed in parallel (default: %(default)s)')
+    parser.add_argument('-n', '--no-cache', action='store_true',
+                        help='neither read nor write the result cache (<output>_cache.jsonl), also with -l')
+    parser.add_argument('-H', '--hash', action='store_true',
+                        help='cached results must also match the sha1 of the file content (reads every file), also with -l')
+    parser.add_argument('-l', '--labels', action='store_true',
+                        help='inputs are Label files (e.g. from NIFTI_Masks2Label), all volumes from one pass per file, cached as the masks')
+    parser.add_argument('-t', '--lut', default=None,
+                        help='with -l: lookup table of label values and structure names (e.g. Label_overlap.csv)')
+    args = parser.parse_args(argv)
+    if args.labels: LabelBatch(args); return
+    FIDfiles = []; subjects = []
+    for root in args.inputs:
+        if not os.path.isdir(root): print ('ERROR: No directory '+root); sys.exit(2)
+        for folder, dirs, files in os.walk(root):
+            dirs.sort()
+            for name in MaskFiles(folder):
+                FIDfiles.append(os.path.abspath(os.path.join(folder,name))); subjects.append(os.path.abspath(folder))
+    if len(FIDfiles)<1: print ('No matching files found'); sys.exit(2)
+    cachefile = os.path.splitext(args.output)[0]+'_cache.jsonl'
+    cache = {}
+    if not args.no_cache: cache = ReadCache(cachefile)
+    stats = dict([(FIDfile, os.stat(FIDfile)) for FIDfile in FIDfiles])
+    pool = multiprocessing.Pool(processes=max(1,min(args.jobs,len(FIDfiles))))
+    try:
+        valid = ValidCache(FIDfiles, cache, stats, args.hash, pool, 'nvoxels')
+        todo = [f for f in FIDfiles if f not in valid]
+        nerrors = 0
+        for FIDfile, nvoxels, voxelsize, sha1, error in pool.imap(MaskVolume_worker, [(f, args.hash) for f in todo], chunksize=8):
+            if error is not None: print ('ERROR: '+FIDfile+': '+error); nerrors+=1; cache.pop(FIDfile, None); continue
+            cache[FIDfile] = {'path':FIDfile, 'size':stats[FIDfile].st_size, 'mtime':stats[FIDfile].st_mtime, 'sha1':sha1,
+                              'nvoxels':nvoxels, 'voxelsize':float(voxelsize)}
+    finally:
+        pool.close(); pool.join()
+    table = []
+    for subject, FIDfile in zip(subjects, FIDfiles):
+        if FIDfile not in cache: continue # failed
+        nvoxels = cache[FIDfile]['nvoxels']
+        volume = nvoxels * np.float32(cache[FIDfile]['voxelsize']) /1000 # in mm^3, as MaskVolume
+        table.append((subject, StructureName(os.path.basename(FIDfile)), nvoxels, volume))
+    if not args.no_cache: WriteCache(cachefile, dict([(f, cache[f]) for f in FIDfiles if f in cache]))
+    WriteCohort(args.output, table, args.format)
+    print ("done, "+str(len(FIDfiles)-nerrors)+" of "+str(len(FIDfiles))+" files of "+str(len(set(subjects)))+" subjects ("+
+           str(len(todo))+" measured, "+str(len(valid))+" cached), cohort table in "+args.output+"\n")
+    if nerrors>0: sys.exit(1)
 
    
 #general initialization stuff  
 Program_name = os.path.basename(sys.argv[0]); 
 if Program_name.find('.')>0: Program_name = Program_name[:Program_name.find('.')]
 python_version=str(sys.version_info[0])+'.'+str(sys.version_info[1])+'.'+str(sys.version_info[2])
-# sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
-if sys.platform=="win32": os.system("title "+Program_name)
-    
-#TK initialization       
-TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
-TKwindows.update()
-# the following tries to disable showing hidden files/folders under linux
-try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
-except: pass
-try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
-except: pass
-TKwindows.update()
-    
-#intercatively choose input folder
-folder = askdirectory(title="Select MIST subject folder ")
-TKwindows.update()
-try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
-except: pass #silent
 
-#get files matching "mist_*_mask.nii.gz"
-files = os.listdir(folder)
-filenames = []
-for name in files: 
-  if fnmatch.fnmatch(name, "mist_*_mask.nii.gz"):
-     filenames.append(name)
-filenames.sort()
-nfiles=len(filenames)
-if nfiles<1: print ('No matching files found'); sys.exit(2)
-
-# start doing something
-out = open(os.path.join(folder,'MIST_ROI_measures.csv'), "w")
-out.write ('Structure name\tVoxel count\tVolume[ml]\n')
-for i in range (0,nfiles):
-    img = nib.load(os.path.join(folder,filenames[i]))
-    data = np.asanyarray(img.dataobj).astype(np.float32)
-    data = SantitizeMask (data)
-    nvoxels = data[data>0].shape[0]
-    SpatResol = np.asarray(img.header.get_zooms())    
-    volume = nvoxels * np.prod(SpatResol) /1000 # in mm^3   
-    structure_name = filenames[i][5:].replace("_mask.nii.gz"," ").replace("_"," ").title()
-    print (structure_name, "-", nvoxels, "voxels", "=", volume, "ml")
-    out.write (structure_name+'\t'+str(nvoxels)+'\t'+str(volume)+'\n')
-out.close()
-
-#end
-if sys.platform=="win32": os.system("pause") # windows
-else: 
-    #os.system('read -s -n 1 -p "Press any key to continue...\n"')
-    import termios
-    print("Press any key to continue...")
-    fd = sys.stdin.fileno()
-    oldterm = termios.tcgetattr(fd)
-    newattr = termios.tcgetattr(fd)
-    newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
-    termios.tcsetattr(fd, termios.TCSANOW, newattr)
-    try: result = sys.stdin.read(1)
-    except IOError: pass
-    finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
+
+if __name__ == '__main__':
+    #command line arguments given: run headless
+    if len(sys.argv)>1: batch (sys.argv[1:]); sys.exit(0)
+
+    TK_installed=True
+    try: from tkFileDialog import askopenfilename # Python 2
+    except: 
+        try: from tkinter.filedialog import askopenfilename; # Python3
+        except: TK_installed=False
+    try: from tkFileDialog import askdirectory # Python 2
+    except: 
+        try: from tkinter.filedialog import askdirectory; # Python3
+        except: TK_installed=False
+    try: import Tkinter as tk; # Python2
+    except: 
+        try: import tkinter as tk; # Python3
+        except: TK_installed=False
+    if not TK_installed:
+        print ('ERROR: tkinter not installed')
+        print ('       on Linux try "yum install tkinter"')
+        print ('       on MacOS install ActiveTcl from:')
+        print ('       http://www.activestate.com/activetcl/downloads')
+        sys.exit(2)
+
+    # sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
+    if sys.platform=="win32": os.system("title "+Program_name)
+        
+    #TK initialization       
+    TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
+    TKwindows.update()
+    # the following tries to disable showing hidden files/folders under linux
+    try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
+    except: pass
+    try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
+    except: pass
+    TKwindows.update()
+        
+    #intercatively choose input folder
+    folder = askdirectory(title="Select MIST subject folder ")
+    TKwindows.update()
+    try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
+    except: pass #silent
+
+    #get files matching "mist_*_mask.nii.gz"
+    filenames = MaskFiles(folder)
+    nfiles=len(filenames)
+    if nfiles<1: print ('No matching files found'); sys.exit(2)
+
+    # start doing something
+    out = open(os.path.join(folder,'MIST_ROI_measures.csv'), "w")
+    out.write ('Structure name\tVoxel count\tVolume[ml]\n')
+    for i in range (0,nfiles):
+        nvoxels, volume = MaskVolume(os.path.join(folder,filenames[i]))
+        structure_name = StructureName(filenames[i])
+        print (structure_name, "-", nvoxels, "voxels", "=", volume, "ml")
+        out.write (structure_name+'\t'+str(nvoxels)+'\t'+str(volume)+'\n')
+    out.close()
+
+    #end
+    if sys.platform=="win32": os.system("pause") # windows
+    else: 
+        #os.system('read -s -n 1 -p "Press any key to continue...\n"')
+        import termios
+        print("Press any key to continue...")
+        fd = sys.stdin.fileno()
+        oldterm = termios.tcgetattr(fd)
+        newattr = termios.tcgetattr(fd)
+        newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
+        termios.tcsetattr(fd, termios.TCSANOW, newattr)
+        try: result = sys.stdin.read(1)
+        except IOError: pass
+        finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
@@ -8,6 +8,15 @@
 # Version 0.1 - 08, May 2020
 #       - 1st public github Release
 #
+# Version 0.2 - 18, October 2026
+#       - the next masks are decoded on worker threads (read-ahead)
+#       - headless batch mode with a bit-packed engine on a process pool
+#       - union, intersection, k-of-N and probability map from a single
+#         counting pass (-m)
+#       - NIFTI files read with the shared loader (ReadNIFTI.py)
+#       - NIFTI files written with the shared writer (WriteNIFTI.py), options
+#         --dtype smallest (uint8 masks), --level and --bgzf, saved in the background
+#
 # ----- LICENSE -----                 
 #
 #    This program is free software: you can redistribute it and/or modify
@@ -40,177 +49,282 @@ except: pass #silent
 from math import floor
 import sys
 import os
+import io
+import glob
+import argparse
+import multiprocessing
 import numpy as np
-import nibabel as nib
-import logging
-
-TK_installed=True
-try: from tkFileDialog import askopenfilename # Python 2
-except: 
-    try: from tkinter.filedialog import askopenfilename; # Python3
-    except: TK_installed=False
-try: import Tkinter as tk; # Python2
-except: 
-    try: import tkinter as tk; # Python3
-    except: TK_installed=False
-if not TK_installed:
-    print ('ERROR: tkinter not installed')
-    print ('       on Linux try "yum install tkinter"')
-    print ('       on MacOS install ActiveTcl from:')
-    print ('       http://www.activestate.com/activetcl/downloads')
-    sys.exit(2)
+from SantitizeMask import SantitizeMask, IsCleanMask
+from ReadNIFTI import ReadNIFTI, LoadNIFTI, ReadAhead
+from WriteNIFTI import WriteNIFTI, BackgroundSaver, AddWriteOptions, WriteOptions
 
     
-def ReadNIFTI(NIFTIfile,logfilename,error_handling): #error_handling = "abort", "warn", "ignore"
-  if error_handling == "ignore": logging.basicConfig(filename=os.devnull)
-  else: logging.basicConfig(filename=logfilename)
-  if error_handling == "abort": # -----> abort on warning/error write msg to screen/logfile
-    nib.imageglobals.error_level = 30  #rise an error
-    try:   
-      with nib.imageglobals.LoggingOutputSuppressor(): # supresss onscreen message
-        return nib.load(NIFTIfile)
-    except Exception as err: 
-      print ("Error reading NIFTI file: "+str(err)) # custom handle error message
-      log.write ("Operation aborted\n"); log.flush() 
-      sys.exit(2)
-  elif error_handling == "warn": # -----> continue on warning/error write msg to screen/logfile
-    try: return nib.load(NIFTIfile)
-    except Exception as err: 
-      print ("Error reading NIFTI file:", err);
-      sys.exit(2)
-  elif error_handling == "ignore": # -----> continue silently
-      with nib.imageglobals.LoggingOutputSuppressor(): # supresss onscreen message
-        return nib.load(NIFTIfile)
-  else: print ("Unknown error handling mode", error_handling); sys.exit(0) 
-  
-  
-#sanity check/correct Mask data
-def SantitizeMask (data):
-   if not np.array_equal(np.unique(data), np.asarray([0,1])):
-      if np.unique(data).shape[0]!=2: # more than two values present
-         data[data<0] = 0
-         thresh = np.average (data[data>0])        
-         print ("Warning: Mask contains more then two different values, trying to fix")
-         log.write("Warning: Mask contains more then two different values, trying to fix\n"); log.flush()
-         data[data<=thresh]=0; data[data>thresh]=1          
-      else: # only two values present, easily corrected  
-         print ("Warning: Mask contains values!=[0,1], trying to fix")
-         log.write("Warning: Mask contains values!=[0,1], trying to fix\n"); log.flush()
-         data[data==np.min(np.unique(data))]=0; data[data==np.max(np.unique(data))]=1 
-   return data
-
-   
-#general initialization stuff  
-Program_name = os.path.basename(sys.argv[0]); 
-if Program_name.find('.')>0: Program_name = Program_name[:Program_name.find('.')]
-python_version=str(sys.version_info[0])+'.'+str(sys.version_info[1])+'.'+str(sys.version_info[2])
-# sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
-if sys.platform=="win32": os.system("title "+Program_name)
-    
-#TK initialization       
-TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
-TKwindows.update()
-# the following tries to disable showing hidden files/folders under linux
-try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
-except: pass
-try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
-except: pass
-TKwindows.update()
-    
-#intercatively choose input FID files
-nfiles=0
-answer="dummy"
-FIDfile=np.array([])
-while answer!="":
-   answer = askopenfilename(title="Choose NIFTI MASK file "+str(nfiles+1)+" (press cancel to end)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
-   if answer!="":
-        answer = os.path.abspath(answer)
-        FIDfile = np.append(FIDfile, answer)
-        nfiles+=1
-if nfiles==0: print ('ERROR: No input file specified'); sys.exit(2)
-if nfiles==1: print ('ERROR: Need at least 2 files'); sys.exit(2)
-TKwindows.update()
-try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
-except: pass #silent
-
-new_dirname = os.path.abspath(os.path.dirname(FIDfile[0]))
-new_filename = 'Combined.nii'
-logfilename = os.path.join(new_dirname,'Combined.log')
-try: os.remove(logfilename)
-except: pass
-log = open(logfilename, "a")
-
-# start doing something
-log.write('Label file created from mask files:\n'); log.flush()
-log.write("1) "+FIDfile[0]+'\n'); log.flush()
-print ('Reading file 1: '+str(os.path.basename(FIDfile[0])))
-img0 = ReadNIFTI(FIDfile[0], logfilename, "warn")
-data0 = np.asanyarray(img0.dataobj).astype(np.float32)
-data0 = SantitizeMask (data0)
-#go
-for i in range (1,nfiles):
+#combines the masks one after the other in a float32 volume
+def Combine(FIDfile,logfilename,log,prefetch):
+  nfiles = len(FIDfile)
+  log.write("1) "+FIDfile[0]+'\n'); log.flush()
+  print ('Reading file 1: '+str(os.path.basename(FIDfile[0])))
+  reader = ReadAhead(FIDfile, logfilename, "warn", prefetch)
+  img0, data0 = next(reader)
+  data0 = data0.astype(np.float32)
+  data0 = SantitizeMask (data0, log)
+  #go
+  for i in range (1,nfiles):
     log.write(str(i+1)+") "+FIDfile[i]+'\n'); log.flush()
     print ('Reading file '+str(i+1)+": "+str(os.path.basename(FIDfile[i])))
-    img = ReadNIFTI(FIDfile[i], logfilename, "warn")
-    data = np.asanyarray(img.dataobj).astype(np.float32)
+    img, data = next(reader)
+    data = data.astype(np.float32)
     #verify if dimensions are equal
     if data.shape != data0.shape:
        print ("ERROR: Mask file has different dimensions, aborting")
        log.write("ERROR: Mask file has different dimensions, aborting\n"); log.flush()
        sys.exit(2)      
-    data = SantitizeMask (data)
+    data = SantitizeMask (data, log)
     #check for overlaping masks    
     nonzero  = np.nonzero(data)
     if not np.array_equal(np.unique(data0[nonzero]), np.asarray([0])):
        print ("Warning: Mask overlap detected, overwriting previous values") 
        log.write("Warning: Mask overlap detected, overwriting previous values\n"); log.flush()       
     data0[nonzero] = 1
-#sanity check result
-expected = np.asarray([0,1])
-if not np.array_equal(np.unique(data0), expected):
+  return img0, data0
+
+
+#counting engine: one uint16 count of masks per voxel from a single pass,
+#all set operations are derived from it
+def CountMasks(FIDfile,logfilename,log,prefetch):
+  nfiles = len(FIDfile)
+  reader = ReadAhead(FIDfile, logfilename, "warn", prefetch)
+  img0 = None
+  for i in range (0,nfiles):
+    log.write(str(i+1)+") "+FIDfile[i]+'\n'); log.flush()
+    print ('Reading file '+str(i+1)+": "+str(os.path.basename(FIDfile[i])))
+    img, data = next(reader)
+    if img0 is None:
+       img0 = img
+       count = np.zeros(data.shape, dtype=np.uint16 if nfiles<=np.iinfo(np.uint16).max else np.uint32)
+    #verify if dimensions are equal
+    if data.shape != count.shape:
+       print ("ERROR: Mask file has different dimensions, aborting")
+       log.write("ERROR: Mask file has different dimensions, aborting\n"); log.flush()
+       sys.exit(2)      
+    data = SantitizeMask (data, log)
+    count += (data!=0)
+  return img0, count
+
+
+#set operations on the mask count: union, intersection, at least k of N masks,
+#or the fraction of masks per voxel (probability map)
+def CountOperation(count,nfiles,operation,k=None):
+  if operation == "union": return (count>0).astype(np.uint8)
+  elif operation == "intersection": return (count==nfiles).astype(np.uint8)
+  elif operation == "atleast": return (count>=k).astype(np.uint8)
+  elif operation == "probability": return (count/np.float32(nfiles)).astype(np.float32)
+  else: raise ValueError("Unknown operation "+str(operation))
+
+
+#worker of the packed engine: ORs a group of masks into one np.packbits bitmap,
+#the log lines are returned to keep the logfile in file order, on errors the
+#bitmap is None and the last log line is the error (no sys.exit in a worker)
+def PackedUnion(job):
+  FIDfiles, first, shape, logfilename = job
+  log = io.StringIO()
+  bits = np.zeros((int(np.prod(shape))+7)//8, dtype=np.uint8)
+  for k in range (0,len(FIDfiles)):
+    log.write(str(first+k+1)+") "+FIDfiles[k]+'\n')
+    try: img, data = LoadNIFTI(FIDfiles[k], threads=1) # one file per worker already
+    except Exception as err:
+       log.write("Error reading NIFTI file: "+str(err)+"\n")
+       return None, log.getvalue()
+    if data.shape != shape:
+       log.write("ERROR: Mask file has different dimensions, aborting\n")
+       return None, log.getvalue()
+    data = SantitizeMask (data, log)
+    np.bitwise_or(bits, np.packbits(data.reshape(-1)!=0), out=bits)
+  return bits, log.getvalue()
+
+
+#packed engine: groups of masks are reduced on a process pool, the partial
+#bitmaps are ORed in the main process and unpacked once at the end
+def CombinePacked(FIDfile,logfilename,log,jobs):
+  nfiles = len(FIDfile)
+  img0 = ReadNIFTI(FIDfile[0], logfilename, "warn")
+  shape = img0.shape
+  ngroups = max(1,min(nfiles,4*jobs))
+  bounds = np.linspace(0,nfiles,ngroups+1).astype(int)
+  groups = [(list(FIDfile[bounds[k]:bounds[k+1]]), bounds[k], shape, logfilename) for k in range (0,ngroups)]
+  bits = np.zeros((int(np.prod(shape))+7)//8, dtype=np.uint8)
+  pool = multiprocessing.Pool(processes=max(1,min(jobs,ngroups)))
+  try:
+    for k, (partial, messages) in enumerate(pool.imap(PackedUnion, groups)):
+      log.write(messages); log.flush()
+      if partial is None:
+         print (messages.splitlines()[-1])
+         sys.exit(2)
+      print ('Combined files '+str(bounds[k]+1)+'-'+str(bounds[k+1])+' of '+str(nfiles))
+      np.bitwise_or(bits, partial, out=bits)
+  finally:
+    pool.terminate(); pool.join()
+  data0 = np.unpackbits(bits, count=int(np.prod(shape))).reshape(shape)
+  return img0, data0
+
+
+#sanity check and save result, with save (default WriteNIFTI) and its options write
+def SaveCombined(data0,img0,filename,log,save=WriteNIFTI,write=None):
+  write = write or {}
+  if not IsCleanMask(data0):
     print ("Warning: Resulting file Label.nii contains unexpected values, please check carefully") 
     log.write("Warning: Resulting file Label.nii contains unexpected values, please check carefully\n"); log.flush()
-data0 = data0.astype(np.int16)
-
-print ("Saving results")
-affine = img0.affine
-sform = int(img0.header['sform_code'])
-qform = int(img0.header['qform_code'])
-unit_xyz, unit_t = img0.header.get_xyzt_units()
-if unit_xyz == 'unknown': unit_xyz=0
-if unit_t   == 'unknown': unit_t=0
-img_SoS = nib.Nifti1Image(data0, affine)
-img_SoS.header.set_xyzt_units(unit_xyz, unit_t)
-img_SoS.set_sform(affine, code=sform)
-img_SoS.set_qform(affine, code=qform)
-img_SoS.header.set_slope_inter(1,0)
-#duno if this is needed
-img_SoS.header['cal_max']=np.max(data0)
-img_SoS.header['extents']=np.min(data0)
-img_SoS.header['regular']=img0.header['regular']
-img_SoS.header['scl_slope']=1
-img_SoS.header['scl_inter']=0
-img_SoS.header['glmax']=np.max(data0)
-img_SoS.header['glmin']=np.min(data0)
-nib.save(img_SoS, os.path.join(new_dirname,new_filename))   
-log.close()
-print ("done\n")  
-     
-#end
-if sys.platform=="win32": os.system("pause") # windows
-else: 
-    #os.system('read -s -n 1 -p "Press any key to continue...\n"')
-    import termios
-    print("Press any key to continue...")
-    fd = sys.stdin.fileno()
-    oldterm = termios.tcgetattr(fd)
-    newattr = termios.tcgetattr(fd)
-    newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
-    termios.tcsetattr(fd, termios.TCSANOW, newattr)
-    try: result = sys.stdin.read(1)
-    except IOError: pass
-    finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
+  data0 = data0.astype(np.int16)
+  print ("Saving results")
+  save (data0, img0.affine, img0.header, filename, **write)
+
+
+#headless batch mode, no Tk windows and no keypress at the end
+def batch(argv):
+  parser = argparse.ArgumentParser(prog=Program_name, description='Combines NIFTI Mask files into a single Mask file')
+  parser.add_argument('files', nargs='+', help='Mask files or glob patterns (e.g. "tracts/*_mask.nii.gz")')
+  parser.add_argument('-o', '--output', default=None,
+                      help='output file, a logfile with the same name is written next to it (default: Combined.nii in the folder of the first file)')
+  parser.add_argument('-p', '--packed', action='store_true',
+                      help='bit-packed engine on a process pool, for thousands of masks (no overlap warnings)')
+  parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                      help='number of processes of the packed engine (default: %(default)s)')
+  parser.add_argument('-m', '--operation', nargs='+', choices=['union','intersection','atleast','probability'], default=None,
+                      help='count the masks per voxel in one pass and save one or more of: union, intersection, '
+                           'atleast (voxels in at least k masks) and probability (fraction of masks, float); '
+                           'with several operations the output name gets the suffix _<operation>')
+  parser.add_argument('-k', type=int, default=None,
+                      help='threshold of the atleast operation (default: majority, N//2+1)')
+  AddWriteOptions(parser)
+  args = parser.parse_args(argv)
+  write = WriteOptions(args)
+  if args.packed and args.operation is not None: print ('ERROR: The packed engine only supports the union'); sys.exit(2)
+  FIDfile = []
+  for pattern in args.files:
+    matches = sorted(glob.glob(pattern))
+    if len(matches)==0: print ('ERROR: No input file matching '+pattern); sys.exit(2)
+    FIDfile.extend([os.path.abspath(f) for f in matches])
+  if len(FIDfile)==1: print ('ERROR: Need at least 2 files'); sys.exit(2)
+  if args.output is None: args.output = os.path.join(os.path.dirname(FIDfile[0]),'Combined.nii')
+  filename = os.path.abspath(args.output)
+  logfilename = os.path.splitext(filename[:-3] if filename.endswith('.gz') else filename)[0]+'.log'
+  try: os.remove(logfilename)
+  except: pass
+  log = open(logfilename, "a")
+  log.write('Label file created from mask files:\n'); log.flush()
+  if args.operation is not None:
+    img0, count = CountMasks(FIDfile, logfilename, log, prefetch)
+    k = args.k if args.k is not None else len(FIDfile)//2+1
+    save, wait = BackgroundSaver(nqueue=2) # next operation while the last one is saved
+    try:
+      for operation in args.operation:
+        data0 = CountOperation(count, len(FIDfile), operation, k)
+        if len(args.operation)>1: 
+          root = filename[:-3] if filename.endswith('.gz') else filename
+          root, ext = os.path.splitext(root)
+          opfilename = root+'_'+operation+ext+('.gz' if filename.endswith('.gz') else '')
+        else: opfilename = filename
+        log.write('Operation '+operation+(' (k='+str(k)+')' if operation=="atleast" else '')+': '+opfilename+'\n'); log.flush()
+        if operation == "probability": 
+          print ("Saving results")
+          save(data0, img0.affine, img0.header, opfilename, **write)
+        else: SaveCombined(data0, img0, opfilename, log, save, write)
+    finally: wait()
+  elif args.packed: 
+    img0, data0 = CombinePacked(FIDfile, logfilename, log, args.jobs)
+    SaveCombined(data0, img0, filename, log, write=write)
+  else: 
+    img0, data0 = Combine(FIDfile, logfilename, log, prefetch)
+    SaveCombined(data0, img0, filename, log, write=write)
+  log.close()
+  print ("done\n")  
+
+
+#general initialization stuff  
+Program_name = os.path.basename(sys.argv[0]); 
+if Program_name.find('.')>0: Program_name = Program_name[:Program_name.find('.')]
+python_version=str(sys.version_info[0])+'.'+str(sys.version_info[1])+'.'+str(sys.version_info[2])
+prefetch = 4 # number of masks decoded ahead
+
+
+if __name__ == '__main__':
+    #command line arguments given: run headless
+    if len(sys.argv)>1: batch (sys.argv[1:]); sys.exit(0)
+
+    TK_installed=True
+    try: from tkFileDialog import askopenfilename # Python 2
+    except: 
+        try: from tkinter.filedialog import askopenfilename; # Python3
+        except: TK_installed=False
+    try: import Tkinter as tk; # Python2
+    except: 
+        try: import tkinter as tk; # Python3
+        except: TK_installed=False
+    if not TK_installed:
+        print ('ERROR: tkinter not installed')
+        print ('       on Linux try "yum install tkinter"')
+        print ('       on MacOS install ActiveTcl from:')
+        print ('       http://www.activestate.com/activetcl/downloads')
+        sys.exit(2)
+
+    # sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
+    if sys.platform=="win32": os.system("title "+Program_name)
+        
+    #TK initialization       
+    TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
+    TKwindows.update()
+    # the following tries to disable showing hidden files/folders under linux
+    try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
+    except: pass
+    try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
+    except: pass
+    TKwindows.update()
+        
+    #intercatively choose input FID files
+    nfiles=0
+    answer="dummy"
+    FIDfile=np.array([])
+    while answer!="":
+       answer = askopenfilename(title="Choose NIFTI MASK file "+str(nfiles+1)+" (press cancel to end)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
+       if answer!="":
+            answer = os.path.abspath(answer)
+            FIDfile = np.append(FIDfile, answer)
+            nfiles+=1
+    if nfiles==0: print ('ERROR: No input file specified'); sys.exit(2)
+    if nfiles==1: print ('ERROR: Need at least 2 files'); sys.exit(2)
+    TKwindows.update()
+    try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
+    except: pass #silent
+
+    new_dirname = os.path.abspath(os.path.dirname(FIDfile[0]))
+    new_filename = 'Combined.nii'
+    logfilename = os.path.join(new_dirname,'Combined.log')
+    try: os.remove(logfilename)
+    except: pass
+    log = open(logfilename, "a")
+
+    # start doing something
+    log.write('Label file created from mask files:\n'); log.flush()
+    img0, data0 = Combine(FIDfile, logfilename, log, prefetch)
+    SaveCombined(data0, img0, os.path.join(new_dirname,new_filename), log)
+    log.close()
+    print ("done\n")  
+         
+    #end
+    if sys.platform=="win32": os.system("pause") # windows
+    else: 
+        #os.system('read -s -n 1 -p "Press any key to continue...\n"')
+        import termios
+        print("Press any key to continue...")
+        fd = sys.stdin.fileno()
+        oldterm = termios.tcgetattr(fd)
+        newattr = termios.tcgetattr(fd)
+        newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
+        termios.tcsetattr(fd, termios.TCSANOW, newattr)
+        try: result = sys.stdin.read(1)
+        except IOError: pass
+        finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
@@ -8,6 +8,16 @@
 # Version 0.1 - 08, May 2020
 #       - 1st public github Release
 #
+# Version 0.2 - 18, October 2026
+#       - headless batch mode: Label files given on the command line
+#         are processed in parallel, without Tk dialogs or keypress
+#       - Masks of .nii.gz Label files are named <name>_MASK_<n> (the former
+#         <name>.nii_MASK_<n> could not be saved by nibabel)
+#       - packed output of all masks in one .npz file (and unpacking)
+#       - NIFTI files read with the shared loader (ReadNIFTI.py)
+#       - NIFTI files written with the shared writer (WriteNIFTI.py), options
+#         --dtype smallest (uint8 masks), --level and --bgzf, saved in the background
+#
 # ----- LICENSE -----                 
 #
 #    This program is free software: you can redistribute it and/or modify
@@ -41,131 +51,328 @@ except: pass #silent
 from math import floor
 import sys
 import os
+import glob
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from scipy.ndimage import label
-from scipy.ndimage import binary_opening
+from scipy.ndimage import find_objects
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 import nibabel as nib
+from ReadNIFTI import LoadNIFTI
+from WriteNIFTI import WriteNIFTI, BackgroundSaver, AddWriteOptions, WriteOptions
+
+
+#strip .nii / .nii.gz from a filename
+def NIFTIbasename (FIDfile):
+    basename = os.path.basename(FIDfile)
+    if basename.endswith('.gz'): basename = basename[:-3]
+    return os.path.splitext(basename)[0]
+
+
+#bounding box (plus margin) of every label value from a single find_objects pass,
+#the margin keeps the volume border of the opening filter outside the label
+def LabelBoxes (data0, labels, margin=2):
+    boxes = [tuple(slice(0,n) for n in data0.shape)]*labels.shape[0]
+    if labels[0]<0: return boxes # find_objects ignores negative values, use full volume
+    objects = find_objects(data0)
+    for i in range (0,labels.shape[0]):
+       if labels[i]>0 and objects[labels[i]-1] is not None:
+          boxes[i] = tuple(slice(max(0,s.start-margin), min(n,s.stop+margin)) for s,n in zip(objects[labels[i]-1],data0.shape))
+    return boxes
+
+
+#one connected component pass over all labels, neighbouring voxels (same face
+#connectivity as label()) are only connected if they carry the same value.
+#Keeps the largest cluster(s) of every label and counts the clusters per label
+def LargestClusters (data0, labels):
+    foreground = data0!=0
+    npoints = np.count_nonzero(foreground)
+    nclusters = np.zeros(labels.shape[0], dtype=np.int64)
+    if npoints==0: return data0, nclusters
+    index = np.zeros(data0.shape, dtype=np.int32 if npoints<2**31 else np.int64)
+    index[foreground] = np.arange(npoints)
+    rows=[]; cols=[]
+    for axis in range (0,len(data0.shape)):
+       lo = [slice(None)]*len(data0.shape); lo[axis]=slice(0,-1); lo=tuple(lo)
+       hi = [slice(None)]*len(data0.shape); hi[axis]=slice(1,None); hi=tuple(hi)
+       same = foreground[lo] & (data0[lo]==data0[hi])
+       rows.append(index[lo][same]); cols.append(index[hi][same])
+    rows = np.concatenate(rows); cols = np.concatenate(cols)
+    graph = coo_matrix((np.ones(rows.shape[0],dtype=np.int8),(rows,cols)), shape=(npoints,npoints))
+    ncomponents, component = connected_components(graph, directed=False)
+    values = data0[foreground]
+    component_label = np.zeros(ncomponents, dtype=np.int64)
+    component_label[component] = np.searchsorted(labels, values)
+    sizes = np.bincount(component, minlength=ncomponents)
+    max_count = np.zeros(labels.shape[0], dtype=sizes.dtype)
+    np.maximum.at(max_count, component_label, sizes)
+    nclusters = np.bincount(component_label, minlength=labels.shape[0])
+    keep = sizes==max_count[component_label] # leave only the largest cluster of connected points
+    data0 = data0.copy()
+    data0[foreground] = np.where(keep[component], values, 0)
+    return data0, nclusters
+
+
+#opening filter for all labels of a Label image at once, gives for every label
+#the same result as binary_opening on its own mask (default cross structure,
+#zero border). The openings of different labels never overlap since each one
+#is contained in its label
+def LabelOpening (data0, iterations=2):
+    ndim = len(data0.shape)
+    def neighbours(axis):
+       lo = [slice(None)]*ndim; lo[axis]=slice(0,-1)
+       hi = [slice(None)]*ndim; hi[axis]=slice(1,None)
+       return tuple(lo), tuple(hi)
+    data = data0
+    for it in range (0,iterations): # erosion, voxels survive if all neighbours carry the same label
+       keep = data!=0
+       for axis in range (0,ndim):
+          lo, hi = neighbours(axis)
+          same = data[lo]==data[hi]
+          keep[lo] &= same; keep[hi] &= same
+          border = [slice(None)]*ndim
+          border[axis]=0; keep[tuple(border)]=False
+          border[axis]=-1; keep[tuple(border)]=False
+       data = np.where(keep, data, 0).astype(data0.dtype)
+    for it in range (0,iterations): # dilation, background voxels take the label of a neighbour
+       grown = data.copy()
+       for axis in range (0,ndim):
+          lo, hi = neighbours(axis)
+          take = (grown[lo]==0) & (data[hi]!=0); grown[lo][take] = data[hi][take]
+          take = (grown[hi]==0) & (data[lo]!=0); grown[hi][take] = data[lo][take]
+       data = grown
+    return data
+
+
+#packed output: all masks of a Label file in one .npz, every mask is stored
+#as np.packbits of its bounding box together with the label value, the box,
+#its dtype and the original header, UnpackMasks restores the Mask files
+def PackMasks (masks, img0, basename, filename):
+    labels = np.asarray([m[0] for m in masks], dtype=np.int64)
+    boxes  = np.asarray([[(s.start,s.stop) for s in m[1]] for m in masks], dtype=np.int64).reshape(-1,3,2)
+    dtypes = np.asarray([np.dtype(m[2]).str for m in masks])
+    bits   = [m[3] for m in masks]
+    offsets = np.cumsum([0]+[b.shape[0] for b in bits])
+    bits = np.concatenate(bits) if len(bits)>0 else np.zeros(0, dtype=np.uint8)
+    np.savez_compressed(filename, labels=labels, boxes=boxes, dtypes=dtypes, offsets=offsets, bits=bits,
+                        shape=np.asarray(img0.shape[:3]), affine=img0.affine, basename=np.asarray(basename),
+                        header=np.frombuffer(img0.header.binaryblock, dtype=np.uint8))
+
+
+#restores the Mask files (all, or only the label values in select) from a packed .npz,
+#write are the options of WriteNIFTI
+def UnpackMasks (NPZfile, outpattern, select=None, report=print, write=None):
+    write = write or {}
+    packed = np.load(NPZfile)
+    if len(packed['header'])==540: header = nib.Nifti2Header(binaryblock=packed['header'].tobytes())
+    else: header = nib.Nifti1Header(binaryblock=packed['header'].tobytes())
+    dirname  = os.path.dirname(NPZfile)
+    basename = str(packed['basename'])
+    shape = tuple(packed['shape'])
+    labels = packed['labels']; offsets = packed['offsets']; bits = packed['bits']
+    n=0
+    for k in range (0,labels.shape[0]):
+       if select is not None and labels[k] not in select: continue
+       box = tuple(slice(start,stop) for start,stop in packed['boxes'][k])
+       boxshape = tuple(s.stop-s.start for s in box)
+       data = np.zeros(shape, dtype=np.dtype(str(packed['dtypes'][k])))
+       data[box] = np.unpackbits(bits[offsets[k]:offsets[k+1]], count=int(np.prod(boxshape))).reshape(boxshape)
+       report ("Unpacking Mask with value "+str(labels[k]))
+       WriteNIFTI (data, packed['affine'], header, outpattern.format(dir=dirname, base=basename, label=labels[k]), **write)
+       n+=1
+    return n
+
+
+#split one Label file into Mask files, output names are build from outpattern
+#using the fields {dir}, {base} and {label}, messages are passed to report,
+#threads>1 creates and saves several masks concurrently, packed=True writes
+#all masks to one .npz (outpattern without {label}) instead of separate files,
+#write are the options of WriteNIFTI (data type, compression)
+def Label2Masks (FIDfile, outpattern, report=print, threads=1, packed=False, write=None):
+    write = write or {}
+    img0, data0 = LoadNIFTI(FIDfile)
+    if len(data0.shape) != 3: raise ValueError('Input is not a 3D NIFTI file')
+    if not (type(data0[0,0,0])==np.int16 or type(data0[0,0,0])==np.int8 or type(data0[0,0,0])==np.uint16 or type(data0[0,0,0])==np.uint8):
+       report ('Warning: Input file is not Integer, converting, please check results carefully')
+       data0 = data0.astype(np.int16) 
+    dirname  = os.path.dirname(FIDfile)
+    basename = NIFTIbasename(FIDfile)
+
+    labels = np.unique(data0)
+    boxes = LabelBoxes(data0, labels)
+    data0, nclusters = LargestClusters(data0, labels)
+    if np.any(nclusters[labels!=0]>1): opened = LabelOpening(data0, iterations=2)
+
+    #creates and saves (or packs) the mask of label number i (the j-th mask),
+    #returns the message and the packed mask
+    def MakeMask (job):
+        i, j = job
+        box = boxes[i]
+        data = data0[box].copy()
+        data[data>labels[i]]=0
+        data[data<labels[i]]=0
+        data[data==labels[i]]=1
+        msg = "Creating Mask "+str(j)+" with value "+str(labels[i])+", "
+        if nclusters[i]>1: #filtering required
+           # isolated clusters were already removed by LargestClusters
+           msg += "removing isolated, "
+           #filter mask (opening filter)
+           msg += "opening filter, "
+           data = (opened[box]==labels[i]).astype(np.int16)
+        if np.max(data)==0:
+            return msg+"zero result", None
+        elif data[data>0].flatten().shape[0]<4:
+            return msg+"too few points: "+str(data[data>0].flatten().shape[0]), None
+        if packed: return msg+"packing", (labels[i], box, data.dtype, np.packbits(data.astype(bool)))
+        #paste the cropped mask back into a full size volume
+        mask = np.zeros(data0.shape, dtype=data.dtype)
+        mask[box] = data
+        save (mask, img0.affine, img0.header, outpattern.format(dir=dirname, base=basename, label=labels[i]), **write)
+        return msg+"saving", None
+
+    jobs = [(i, j+1) for j, i in enumerate(np.nonzero(labels)[0])]
+    masks = []
+    if threads>1: # ndimage and zlib release the GIL, map keeps the label order of the messages
+        save = WriteNIFTI
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for msg, mask in executor.map(MakeMask, jobs):
+                report (msg)
+                if mask is not None: masks.append(mask)
+    else: # the next mask is made while the last one is saved
+        save, wait = BackgroundSaver(nqueue=2)
+        try:
+            for msg, mask in map(MakeMask, jobs):
+                report (msg)
+                if mask is not None: masks.append(mask)
+        finally: wait() # queued saves are always finished, their errors raised
+    if packed:
+        report ("Saving "+str(len(masks))+" packed Masks")
+        PackMasks (masks, img0, basename, outpattern.format(dir=dirname, base=basename))
+    return len(jobs)
+
+
+#worker for the batch mode, collects the messages instead of printing them
+#so that the output of parallel jobs does not get mixed up
+def Label2Masks_worker (job):
+    FIDfile, outpattern, threads, packed, unpack, select, write = job
+    messages = []
+    try: 
+        if unpack: UnpackMasks (FIDfile, outpattern, select=select, report=messages.append, write=write)
+        else: Label2Masks (FIDfile, outpattern, report=messages.append, threads=threads, packed=packed, write=write)
+        ok=True
+    except Exception as err: messages.append ("ERROR: "+str(err)); ok=False
+    return FIDfile, messages, ok
+
+
+#headless batch mode, no Tk windows and no keypress at the end
+def batch (argv):
+    parser = argparse.ArgumentParser(prog=Program_name, description='Converts NIFTI Label files to Mask files (one per label value)')
+    parser.add_argument('files', nargs='+', help='Label files or glob patterns (e.g. "subj*/aparc.nii.gz")')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output filename pattern with the fields {dir}, {base} and {label} (default: {dir}/{base}_MASK_{label}.nii.gz, packed: {dir}/{base}_MASKS.npz)')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of Label files processed in parallel (default: %(default)s)')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='number of masks of one Label file created and saved in parallel (default: %(default)s)')
+    parser.add_argument('-p', '--packed', action='store_true',
+                        help='write all masks of a Label file bit-packed into one .npz file')
+    parser.add_argument('-u', '--unpack', action='store_true',
+                        help='input files are packed .npz files, restore the separate Mask files')
+    parser.add_argument('-l', '--labels', type=int, nargs='+', default=None,
+                        help='with --unpack: restore only the Masks of these label values')
+    AddWriteOptions(parser)
+    args = parser.parse_args(argv)
+    if args.output is None:
+        if args.packed and not args.unpack: args.output = os.path.join('{dir}','{base}_MASKS.npz')
+        else: args.output = os.path.join('{dir}','{base}_MASK_{label}.nii.gz')
+    FIDfiles = []
+    for pattern in args.files:
+        matches = sorted(glob.glob(pattern))
+        if len(matches)==0: print ('ERROR: No input file matching '+pattern); sys.exit(2)
+        FIDfiles.extend([os.path.abspath(f) for f in matches])
+    jobs = [(FIDfile, args.output, args.threads, args.packed, args.unpack, args.labels, WriteOptions(args)) for FIDfile in FIDfiles]
+    nerrors = 0
+    pool = multiprocessing.Pool(processes=max(1,min(args.jobs,len(jobs))))
+    try:
+        for FIDfile, messages, ok in pool.imap(Label2Masks_worker, jobs):
+            print ("Processing "+FIDfile)
+            for msg in messages: print ("   "+msg)
+            if not ok: nerrors+=1
+    finally:
+        pool.close(); pool.join()
+    print ("done, "+str(len(jobs)-nerrors)+" of "+str(len(jobs))+" files processed\n")
+    if nerrors>0: sys.exit(1)
 
 
-TK_installed=True
-try: from tkFileDialog import askopenfilename # Python 2
-except: 
-    try: from tkinter.filedialog import askopenfilename; # Python3
-    except: TK_installed=False
-try: import Tkinter as tk; # Python2
-except: 
-    try: import tkinter as tk; # Python3
-    except: TK_installed=False
-if not TK_installed:
-    print ('ERROR: tkinter not installed')
-    print ('       on Linux try "yum install tkinter"')
-    print ('       on MacOS install ActiveTcl from:')
-    print ('       http://www.activestate.com/activetcl/downloads')
-    sys.exit(2)
-    
-    
 #general initialization stuff  
 Program_name = os.path.basename(sys.argv[0]); 
 if Program_name.find('.')>0: Program_name = Program_name[:Program_name.find('.')]
 python_version=str(sys.version_info[0])+'.'+str(sys.version_info[1])+'.'+str(sys.version_info[2])
-# sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
-if sys.platform=="win32": os.system("title "+Program_name)
-    
-#TK initialization       
-TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
-TKwindows.update()
-# the following tries to disable showing hidden files/folders under linux
-try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
-except: pass
-try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
-except: pass
-TKwindows.update()
-    
-#intercatively choose input FID file and read data
-FIDfile = askopenfilename(title="Choose NIFTI MASK file (press cancel to end)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
-if FIDfile=="": print ('ERROR: No input file specified'); sys.exit(2)
-FIDfile = os.path.abspath(FIDfile)
-img0 = nib.load(FIDfile)
-data0 = np.asanyarray(img0.dataobj)
-if len(data0.shape) != 3:print ('ERROR: Input is not a 3D NIFTI file'); sys.exit(2) 
-if not (type(data0[0,0,0])==np.int16 or type(data0[0,0,0])==np.int8 or type(data0[0,0,0])==np.uint16 or type(data0[0,0,0])==np.uint8):
-   print ('Warning: Input file is not Integer, converting, please check results carefully')
-   data0 = data0.astype(np.int16) 
-dirname  = os.path.dirname(FIDfile)
-basename = os.path.splitext(os.path.basename(FIDfile))[0]
-   
-TKwindows.update()
-try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
-except: pass #silent
 
-labels = np.unique(data0)
-nfiles = labels.shape[0]
-j=0
-for i in range (0,nfiles):
-   if labels[i]!=0:
-      data = data0.copy()
-      data[data>labels[i]]=0
-      data[data<labels[i]]=0
-      data[data==labels[i]]=1
-      j+=1
-      print ("Creating Mask "+str(j)+" with value "+str(labels[i])+", ", end="")
-      labeled_data, num_clusters = label(data)
-      unique, counts = np.unique(labeled_data, return_counts=True)
-      if (unique.shape[0])>2: #filtering required
-         # remove isolated clusters
-         print ("removing isolated, ", end="")
-         max_count=0
-         for k in range(0,unique.shape[0]): # find the largest nonzero count
-            if counts[k]>max_count and unique[k]!=0: max_count=counts[k]
-         remove_labels = unique[np.where(counts<max_count)] # leave only the largest cluster of connected points
-         remove_indices = np.where(np.isin(labeled_data,remove_labels))
-         data[remove_indices] = 0
-         #filter mask (opening filter)
-         print ("opening filter, ", end="")
-         data = binary_opening(data, iterations=2).astype(np.int16)
-      if np.max(data)==0:
-          print ("zero result")
-      elif data[data>0].flatten().shape[0]<4:
-          print ("too few points: ", data[data>0].flatten().shape[0])            
-      else:            
-          print ("saving")
-          affine = img0.affine
-          sform = int(img0.header['sform_code'])
-          qform = int(img0.header['qform_code'])
-          unit_xyz, unit_t = img0.header.get_xyzt_units()
-          if unit_xyz == 'unknown': unit_xyz=0
-          if unit_t   == 'unknown': unit_t=0
-          img_SoS = nib.Nifti1Image(data, affine)
-          img_SoS.header.set_xyzt_units(unit_xyz, unit_t)
-          img_SoS.set_sform(affine, code=sform)
-          img_SoS.set_qform(affine, code=qform)
-          img_SoS.header.set_slope_inter(1,0)
-          #duno if this is needed
-          img_SoS.header['cal_max']=np.max(data)
-          img_SoS.header['extents']=np.min(data)
-          img_SoS.header['regular']=img0.header['regular']
-          img_SoS.header['scl_slope']=1
-          img_SoS.header['scl_inter']=0
-          img_SoS.header['glmax']=np.max(data)
-          img_SoS.header['glmin']=np.min(data)
-          nib.save(img_SoS, os.path.join(dirname,basename+"_MASK_"+str(labels[i])))   
-print ("done\n")  
-     
-#end
-if sys.platform=="win32": os.system("pause") # windows
-else: 
-    #os.system('read -s -n 1 -p "Press any key to continue...\n"')
-    import termios
-    print("Press any key to continue...")
-    fd = sys.stdin.fileno()
-    oldterm = termios.tcgetattr(fd)
-    newattr = termios.tcgetattr(fd)
-    newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
-    termios.tcsetattr(fd, termios.TCSANOW, newattr)
-    try: result = sys.stdin.read(1)
-    except IOError: pass
-    finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
+
+if __name__ == '__main__':
+    #command line arguments given: run headless
+    if len(sys.argv)>1: batch (sys.argv[1:]); sys.exit(0)
+
+    TK_installed=True
+    try: from tkFileDialog import askopenfilename # Python 2
+    except: 
+        try: from tkinter.filedialog import askopenfilename; # Python3
+        except: TK_installed=False
+    try: import Tkinter as tk; # Python2
+    except: 
+        try: import tkinter as tk; # Python3
+        except: TK_installed=False
+    if not TK_installed:
+        print ('ERROR: tkinter not installed')
+        print ('       on Linux try "yum install tkinter"')
+        print ('       on MacOS install ActiveTcl from:')
+        print ('       http://www.activestate.com/activetcl/downloads')
+        sys.exit(2)
+
+    # sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
+    if sys.platform=="win32": os.system("title "+Program_name)
+        
+    #TK initialization       
+    TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
+    TKwindows.update()
+    # the following tries to disable showing hidden files/folders under linux
+    try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
+    except: pass
+    try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
+    except: pass
+    TKwindows.update()
+        
+    #intercatively choose input FID file
+    FIDfile = askopenfilename(title="Choose NIFTI MASK file (press cancel to end)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
+    if FIDfile=="": print ('ERROR: No input file specified'); sys.exit(2)
+    FIDfile = os.path.abspath(FIDfile)
+       
+    TKwindows.update()
+    try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
+    except: pass #silent
+
+    try: Label2Masks (FIDfile, os.path.join('{dir}','{base}_MASK_{label}'))
+    except ValueError as err: print ('ERROR: '+str(err)); sys.exit(2)
+    print ("done\n")  
+         
+    #end
+    if sys.platform=="win32": os.system("pause") # windows
+    else: 
+        #os.system('read -s -n 1 -p "Press any key to continue...\n"')
+        import termios
+        print("Press any key to continue...")
+        fd = sys.stdin.fileno()
+        oldterm = termios.tcgetattr(fd)
+        newattr = termios.tcgetattr(fd)
+        newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
+        termios.tcsetattr(fd, termios.TCSANOW, newattr)
+        try: result = sys.stdin.read(1)
+        except IOError: pass
+        finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
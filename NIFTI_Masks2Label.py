@@ -8,6 +8,15 @@
 # Version 0.1 - 08, May 2020
 #       - 1st public github Release
 #
+# Version 0.2 - 18, October 2026
+#       - masks are merged in their native dtype into an uint8/uint16
+#         accumulator instead of float32 copies
+#       - the next masks are decoded on worker threads (read-ahead)
+#       - pairwise overlap matrix (Label_overlap.csv) and coverage map
+#         (Label_coverage.nii) from the same pass
+#       - NIFTI files read with the shared loader (ReadNIFTI.py)
+#       - NIFTI files written with the shared writer (WriteNIFTI.py)
+#
 # ----- LICENSE -----                 
 #
 #    This program is free software: you can redistribute it and/or modify
@@ -41,176 +50,174 @@ from math import floor
 import sys
 import os
 import numpy as np
-import nibabel as nib
-import logging
+from SantitizeMask import SantitizeMask
+from ReadNIFTI import ReadAhead
+from WriteNIFTI import WriteNIFTI
 
-TK_installed=True
-try: from tkFileDialog import askopenfilename # Python 2
-except: 
-    try: from tkinter.filedialog import askopenfilename; # Python3
-    except: TK_installed=False
-try: import Tkinter as tk; # Python2
-except: 
-    try: import tkinter as tk; # Python3
-    except: TK_installed=False
-if not TK_installed:
-    print ('ERROR: tkinter not installed')
-    print ('       on Linux try "yum install tkinter"')
-    print ('       on MacOS install ActiveTcl from:')
-    print ('       http://www.activestate.com/activetcl/downloads')
-    sys.exit(2)
 
-    
-def ReadNIFTI(NIFTIfile,logfilename,error_handling): #error_handling = "abort", "warn", "ignore"
-  if error_handling == "ignore": logging.basicConfig(filename=os.devnull)
-  else: logging.basicConfig(filename=logfilename)
-  if error_handling == "abort": # -----> abort on warning/error write msg to screen/logfile
-    nib.imageglobals.error_level = 30  #rise an error
-    try:   
-      with nib.imageglobals.LoggingOutputSuppressor(): # supresss onscreen message
-        return nib.load(NIFTIfile)
-    except Exception as err: 
-      print ("Error reading NIFTI file: "+str(err)) # custom handle error message
-      log.write ("Operation aborted\n"); log.flush() 
-      sys.exit(2)
-  elif error_handling == "warn": # -----> continue on warning/error write msg to screen/logfile
-    try: return nib.load(NIFTIfile)
-    except Exception as err: 
-      print ("Error reading NIFTI file:", err);
-      sys.exit(2)
-  elif error_handling == "ignore": # -----> continue silently
-      with nib.imageglobals.LoggingOutputSuppressor(): # supresss onscreen message
-        return nib.load(NIFTIfile)
-  else: print ("Unknown error handling mode", error_handling); sys.exit(0) 
+#pairwise overlap bookkeeping for mask i (flat voxel indices), called before it
+#is merged: voxels covered once know their mask from the label volume, voxels
+#covered more often are kept sorted in shared with a bitmask of their masks
+#(np.packbits order), only the voxels of mask i are looked up; returns the overlap size
+def CountOverlap(index,i,data0,coverage,matrix,shared):
+  label = data0.reshape(-1); count = coverage.reshape(-1)
+  counts = count[index]
+  matrix[i,i] = index.shape[0]
+  nfiles = matrix.shape[0]; bit = np.uint8(0x80>>(i%8))
+  more = index[counts>1]
+  if more.shape[0]>0: # masks of these voxels from their bitmasks, byte by byte
+    rows = np.searchsorted(shared['voxels'], more)
+    table = np.unpackbits(np.arange(256, dtype=np.uint8)[:,None], axis=1).astype(np.int64) # bits of every byte value
+    for j in range (0,shared['bits'].shape[1]):
+      matrix[i,8*j:8*j+8] += np.dot(np.bincount(shared['bits'][rows,j], minlength=256), table)[:nfiles-8*j]
+    shared['bits'][rows,i//8] |= bit
+  once = index[counts==1]
+  if once.shape[0]>0: # the label volume still holds the only previous mask
+    previous = label[once].astype(np.int64)-1
+    matrix[i,:] += np.bincount(previous, minlength=nfiles)
+    bits = np.zeros((once.shape[0],shared['bits'].shape[1]), dtype=np.uint8)
+    bits[np.arange(once.shape[0]),previous//8] = (0x80>>(previous%8)).astype(np.uint8)
+    bits[:,i//8] |= bit
+    rows = np.searchsorted(shared['voxels'], once)
+    shared['voxels'] = np.insert(shared['voxels'], rows, once); shared['bits'] = np.insert(shared['bits'], rows, bits, axis=0)
+  count[index] += 1
+  return more.shape[0]+once.shape[0]
   
-  
-#sanity check/correct Mask data
-def SantitizeMask (data):
-   if not np.array_equal(np.unique(data), np.asarray([0,1])):
-      if np.unique(data).shape[0]!=2: # more than two values present
-         data[data<0] = 0
-         thresh = np.average (data[data>0])        
-         print ("Warning: Mask contains more then two different values, trying to fix")
-         log.write("Warning: Mask contains more then two different values, trying to fix\n"); log.flush()
-         data[data<=thresh]=0; data[data>thresh]=1          
-      else: # only two values present, easily corrected  
-         print ("Warning: Mask contains values!=[0,1], trying to fix")
-         log.write("Warning: Mask contains values!=[0,1], trying to fix\n"); log.flush()
-         data[data==np.min(np.unique(data))]=0; data[data==np.max(np.unique(data))]=1 
-   return data
 
    
 #general initialization stuff  
 Program_name = os.path.basename(sys.argv[0]); 
 if Program_name.find('.')>0: Program_name = Program_name[:Program_name.find('.')]
 python_version=str(sys.version_info[0])+'.'+str(sys.version_info[1])+'.'+str(sys.version_info[2])
-# sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
-if sys.platform=="win32": os.system("title "+Program_name)
+
+
+if __name__ == '__main__':
+    TK_installed=True
+    try: from tkFileDialog import askopenfilename # Python 2
+    except: 
+        try: from tkinter.filedialog import askopenfilename; # Python3
+        except: TK_installed=False
+    try: import Tkinter as tk; # Python2
+    except: 
+        try: import tkinter as tk; # Python3
+        except: TK_installed=False
+    if not TK_installed:
+        print ('ERROR: tkinter not installed')
+        print ('       on Linux try "yum install tkinter"')
+        print ('       on MacOS install ActiveTcl from:')
+        print ('       http://www.activestate.com/activetcl/downloads')
+        sys.exit(2)
+
+    # sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
+    if sys.platform=="win32": os.system("title "+Program_name)
     
-#TK initialization       
-TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
-TKwindows.update()
-# the following tries to disable showing hidden files/folders under linux
-try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
-except: pass
-try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
-except: pass
-TKwindows.update()
+    #TK initialization       
+    TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
+    TKwindows.update()
+    # the following tries to disable showing hidden files/folders under linux
+    try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
+    except: pass
+    try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
+    except: pass
+    TKwindows.update()
     
-#intercatively choose input FID files
-nfiles=0
-answer="dummy"
-FIDfile=np.array([])
-while answer!="":
-   answer = askopenfilename(title="Choose NIFTI MASK file "+str(nfiles+1)+" (press cancel to end)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
-   if answer!="":
-        answer = os.path.abspath(answer)
-        FIDfile = np.append(FIDfile, answer)
-        nfiles+=1
-if nfiles==0: print ('ERROR: No input file specified'); sys.exit(2)
-if nfiles==1: print ('ERROR: Need at least 2 files'); sys.exit(2)
-TKwindows.update()
-try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
-except: pass #silent
+    #intercatively choose input FID files
+    nfiles=0
+    answer="dummy"
+    FIDfile=np.array([])
+    while answer!="":
+       answer = askopenfilename(title="Choose NIFTI MASK file "+str(nfiles+1)+" (press cancel to end)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
+       if answer!="":
+            answer = os.path.abspath(answer)
+            FIDfile = np.append(FIDfile, answer)
+            nfiles+=1
+    if nfiles==0: print ('ERROR: No input file specified'); sys.exit(2)
+    if nfiles==1: print ('ERROR: Need at least 2 files'); sys.exit(2)
+    TKwindows.update()
+    try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
+    except: pass #silent
 
-new_dirname = os.path.abspath(os.path.dirname(FIDfile[0]))
-new_filename = 'Label.nii'
-logfilename = os.path.join(new_dirname,'Label.log')
-try: os.remove(logfilename)
-except: pass
-log = open(logfilename, "a")
+    new_dirname = os.path.abspath(os.path.dirname(FIDfile[0]))
+    new_filename = 'Label.nii'
+    prefetch = 4 # number of masks decoded ahead
+    save_coverage = True # if masks overlap also save Label_coverage.nii (number of masks per voxel)
+    logfilename = os.path.join(new_dirname,'Label.log')
+    try: os.remove(logfilename)
+    except: pass
+    log = open(logfilename, "a")
 
-# start doing something
-log.write('Label file created from mask files:\n'); log.flush()
-log.write("1) "+FIDfile[0]+'\n'); log.flush()
-print ('Reading file 1: '+str(os.path.basename(FIDfile[0])))
-img0 = ReadNIFTI(FIDfile[0], logfilename, "warn")
-data0 = np.asanyarray(img0.dataobj).astype(np.float32)
-data0 = SantitizeMask (data0)
-#go
-for i in range (1,nfiles):
-    log.write(str(i+1)+") "+FIDfile[i]+'\n'); log.flush()
-    print ('Reading file '+str(i+1)+": "+str(os.path.basename(FIDfile[i])))
-    img = ReadNIFTI(FIDfile[i], logfilename, "warn")
-    data = np.asanyarray(img.dataobj).astype(np.float32)
-    #verify if dimensions are equal
-    if data.shape != data0.shape:
-       print ("ERROR: Mask file has different dimensions, aborting")
-       log.write("ERROR: Mask file has different dimensions, aborting\n"); log.flush()
-       sys.exit(2)      
-    data = SantitizeMask (data)
-    #check for overlaping masks    
-    nonzero  = np.nonzero(data)
-    if not np.array_equal(np.unique(data0[nonzero]), np.asarray([0])):
-       print ("Warning: Mask overlap detected, overwriting previous values") 
-       log.write("Warning: Mask overlap detected, overwriting previous values\n"); log.flush()       
-    data0[nonzero] = (i+1)
-#sanity check result
-expected = np.linspace(0,nfiles,nfiles+1, endpoint=True)
-if not np.array_equal(np.unique(data0), expected):
-    print ("Warning: Resulting file Label.nii contains unexpected values, please check carefully") 
-    log.write("Warning: Resulting file Label.nii contains unexpected values, please check carefully\n"); log.flush()
-data0 = data0.astype(np.int16)
+    # start doing something
+    log.write('Label file created from mask files:\n'); log.flush()
+    #masks are read in their native dtype and merged into the smallest
+    #integer accumulator that can hold the label count; peak memory: the label
+    #and the coverage accumulator (1 or 2 bytes per voxel each, coverage is
+    #also needed for the overlap count), the current mask plus up to prefetch
+    #masks decoded ahead (native dtype), and 1 bit per mask for each voxel
+    #covered more than once
+    if nfiles<=np.iinfo(np.uint8).max: acc_dtype = np.uint8
+    else: acc_dtype = np.uint16
+    img0 = None
+    reader = ReadAhead(FIDfile, logfilename, "warn", prefetch)
+    for i in range (0,nfiles):
+        log.write(str(i+1)+") "+FIDfile[i]+'\n'); log.flush()
+        print ('Reading file '+str(i+1)+": "+str(os.path.basename(FIDfile[i])))
+        img, data = next(reader)
+        if img0 is None: 
+           img0 = img
+           data0 = np.zeros(data.shape, dtype=acc_dtype)
+           coverage = np.zeros(data.shape, dtype=acc_dtype)
+           matrix = np.zeros((nfiles,nfiles), dtype=np.int64)
+           shared = {'voxels':np.zeros(0, dtype=np.intp), 'bits':np.zeros((0,(nfiles+7)//8), dtype=np.uint8)}
+        #verify if dimensions are equal
+        if data.shape != data0.shape:
+           print ("ERROR: Mask file has different dimensions, aborting")
+           log.write("ERROR: Mask file has different dimensions, aborting\n"); log.flush()
+           sys.exit(2)      
+        data = SantitizeMask (data, log)
+        #check for overlaping masks    
+        index = np.flatnonzero(data)
+        del data
+        noverlap = CountOverlap(index, i, data0, coverage, matrix, shared)
+        if noverlap>0:
+           print ("Warning: Mask overlap detected ("+str(noverlap)+" voxels), overwriting previous values") 
+           log.write("Warning: Mask overlap detected ("+str(noverlap)+" voxels), overwriting previous values\n"); log.flush()       
+        data0.reshape(-1)[index] = (i+1)
+        del index
+    matrix = np.maximum(matrix, matrix.T)
+    #sanity check result, every label 0..N must be present
+    if not np.all(np.bincount(data0.ravel(), minlength=nfiles+1)>0):
+        print ("Warning: Resulting file Label.nii contains unexpected values, please check carefully") 
+        log.write("Warning: Resulting file Label.nii contains unexpected values, please check carefully\n"); log.flush()
+    data0 = data0.astype(np.int16)
 
-print ("Saving results")
-affine = img0.affine
-sform = int(img0.header['sform_code'])
-qform = int(img0.header['qform_code'])
-unit_xyz, unit_t = img0.header.get_xyzt_units()
-if unit_xyz == 'unknown': unit_xyz=0
-if unit_t   == 'unknown': unit_t=0
-img_SoS = nib.Nifti1Image(data0, affine)
-img_SoS.header.set_xyzt_units(unit_xyz, unit_t)
-img_SoS.set_sform(affine, code=sform)
-img_SoS.set_qform(affine, code=qform)
-img_SoS.header.set_slope_inter(1,0)
-#duno if this is needed
-img_SoS.header['cal_max']=np.max(data0)
-img_SoS.header['extents']=np.min(data0)
-img_SoS.header['regular']=img0.header['regular']
-img_SoS.header['scl_slope']=1
-img_SoS.header['scl_inter']=0
-img_SoS.header['glmax']=np.max(data0)
-img_SoS.header['glmin']=np.min(data0)
-nib.save(img_SoS, os.path.join(new_dirname,new_filename))   
-log.close()
-print ("done\n")  
+    print ("Saving results")
+    WriteNIFTI (data0, img0.affine, img0.header, os.path.join(new_dirname,new_filename))
+    #overlap sidecars: voxel counts of every mask pair (diagonal: mask size)
+    with open(os.path.join(new_dirname,'Label_overlap.csv'), "w") as csv_file:
+        csv_file.write("Label,File,"+",".join([str(k+1) for k in range(0,nfiles)])+"\n")
+        for i in range(0,nfiles):
+            csv_file.write(str(i+1)+","+os.path.basename(FIDfile[i])+","+",".join([str(v) for v in matrix[i]])+"\n")
+    if save_coverage and np.max(coverage)>1:
+        print ("Saving overlap map Label_coverage.nii")
+        WriteNIFTI (coverage.astype(np.int16), img0.affine, img0.header, os.path.join(new_dirname,'Label_coverage.nii'))
+    log.close()
+    print ("done\n")  
      
-#end
-if sys.platform=="win32": os.system("pause") # windows
-else: 
-    #os.system('read -s -n 1 -p "Press any key to continue...\n"')
-    import termios
-    print("Press any key to continue...")
-    fd = sys.stdin.fileno()
-    oldterm = termios.tcgetattr(fd)
-    newattr = termios.tcgetattr(fd)
-    newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
-    termios.tcsetattr(fd, termios.TCSANOW, newattr)
-    try: result = sys.stdin.read(1)
-    except IOError: pass
-    finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
+    #end
+    if sys.platform=="win32": os.system("pause") # windows
+    else: 
+        #os.system('read -s -n 1 -p "Press any key to continue...\n"')
+        import termios
+        print("Press any key to continue...")
+        fd = sys.stdin.fileno()
+        oldterm = termios.tcgetattr(fd)
+        newattr = termios.tcgetattr(fd)
+        newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
+        termios.tcsetattr(fd, termios.TCSANOW, newattr)
+        try: result = sys.stdin.read(1)
+        except IOError: pass
+        finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
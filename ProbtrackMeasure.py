@@ -8,6 +8,14 @@
 # Version 0.1 - 08, May 2020
 #       - 1st public github Release
 #
+# Version 0.2 - 18, October 2026
+#       - "(all)" table written in chunks, optionally as .npy/.npz/.parquet
+#         (batch option --all-format)
+#       - all statistics from one extraction of the weighted voxels
+#       - headless atlas mode (-l): statistics in all regions of a Label file
+#       - headless weighted statistics streamed in z-slabs (memory ceiling -m)
+#       - NIFTI files read with the shared loader (ReadNIFTI.py)
+#
 # ----- LICENSE -----                 
 #
 #    This program is free software: you can redistribute it and/or modify
@@ -39,191 +47,378 @@ try: import win32gui, win32console
 except: pass #silent
 import sys
 import os
+import argparse
 import numpy as np
 import nibabel as nib
+from WriteTable import WriteTable
+from ReadNIFTI import LoadNIFTI
 import warnings 
 warnings.filterwarnings("ignore") # disable numpy runtime warnings
 
-TK_installed=True
-try: from tkFileDialog import askopenfilename # Python 2
-except: 
-    try: from tkinter.filedialog import askopenfilename; # Python3
-    except: TK_installed=False
-try: import Tkinter as tk; # Python2
-except: 
-    try: import tkinter as tk; # Python3
-    except: TK_installed=False
-if not TK_installed:
-    print ('ERROR: tkinter not installed')
-    print ('       on Linux try "yum install tkinter"')
-    print ('       on MacOS install ActiveTcl from:')
-    print ('       http://www.activestate.com/activetcl/downloads')
-    sys.exit(2)
-
 def smooth(x,window_len):
     w=np.hanning(window_len)
     s=np.r_[2*x[0]-x[window_len-1::-1],x,2*x[-1]-x[-1:-window_len:-1]]
     w=np.hanning(window_len)
     y=np.convolve(w/w.sum(),s,mode='same')
     return y[window_len:-window_len+1]    
+
+
+#statistics of a scalar image for every region of a Label file in one pass:
+#voxel count, average, weighted average (weights image, if given), median,
+#minimum and maximum; sums via np.bincount, median/min/max from one sort
+def AtlasStatistics(data0, labels, weights=None):
+    inside = labels>0
+    label = labels[inside].astype(np.int64)
+    values = data0[inside].astype(np.float64)
+    count = np.bincount(label)
+    ids = np.flatnonzero(count)
+    total = np.bincount(label, weights=values)
+    if weights is not None:
+        w = weights[inside].astype(np.float64)
+        weighted = np.bincount(label, weights=w*values)[ids] / np.bincount(label, weights=w)[ids]
+    else: weighted = total[ids]/count[ids]
+    order = np.lexsort((values, label)) # by label, then by value
+    values = values[order]
+    first = np.cumsum(count)[ids]-count[ids]; n = count[ids]
+    median = (values[first+(n-1)//2] + values[first+n//2])/2 # as np.median
+    return {'label':ids, 'count':n, 'average':total[ids]/n, 'weighted':weighted,
+            'median':median, 'minimum':values[first], 'maximum':values[first+n-1]}
+
+
+#reads both images in z-slabs (sliced dataobj, never the whole volume) of at most
+#about memory MB, yields values and weights of the voxels with nonzero weight
+def ReadSlabs(img0, img1, memory):
+    nx, ny, nz = img0.shape
+    nslab = max(1, int(memory*2**20 / (nx*ny*8*6))) # float64 data plus temporaries, both images
+    for z in range (0,nz,nslab):
+        data0 = np.asanyarray(img0.dataobj[:,:,z:z+nslab])
+        data1 = np.asanyarray(img1.dataobj[:,:,z:z+nslab])
+        nonzero = data1!=0
+        yield data0[nonzero], data1[nonzero]
+
+
+#bin index of values in nbins equal bins from lo to hi (outliers clipped into the end bins)
+def BinIndex(values, lo, hi, nbins):
+    if hi<=lo: return np.zeros(values.shape[0], dtype=np.int64)
+    index = ((values.astype(np.float64)-lo)*(nbins/(hi-lo))).astype(np.int64)
+    return np.clip(index, 0, nbins-1)
+
+
+#the values with positive weight that are still median candidates after the
+#bins chosen so far (each filter is lo, hi, nbins, first bin, last bin)
+def Candidates(img0, img1, memory, filters):
+    for values, weights in ReadSlabs(img0, img1, memory):
+        values = values[weights>0] # native type, histogram bins as in the interactive mode
+        for lo, hi, nbins, b1, b2 in filters:
+            index = BinIndex(values, lo, hi, nbins)
+            values = values[(index>=b1) & (index<=b2)]
+        yield values
+
+
+#voxel statistics as in the interactive mode, out-of-core: count, sums, minimum
+#and maximum accumulated over the slabs, histogram exact in a second pass on the
+#now known bins, the median exact by histogram refinement: every further pass
+#only keeps the bins holding the middle rank(s) until they fit into memory
+def StreamStatistics(img0, img1, memory=256, nbins=65536):
+    npoints = 0; total = 0.; wtotal = 0.; wsum = 0.; vmin = np.inf; vmax = -np.inf
+    for values, weights in ReadSlabs(img0, img1, memory):
+        wtotal += np.dot(values.astype(np.float64), weights.astype(np.float64)); wsum += np.sum(weights, dtype=np.float64)
+        values = values[weights>0]
+        if values.shape[0]==0: continue
+        npoints += values.shape[0]; total += np.sum(values, dtype=np.float64)
+        if npoints==values.shape[0]: vmin = np.min(values); vmax = np.max(values) # native type, as the histogram bins
+        else: vmin = min(vmin, np.min(values)); vmax = max(vmax, np.max(values))
+    if npoints==0: print ('ERROR: No voxels with positive weight'); sys.exit(2)
+    xbins = np.linspace(vmin,vmax,int(np.sqrt(npoints)))
+    ybins = np.zeros(max(0,xbins.shape[0]-1), dtype=np.int64)
+    k1 = (npoints-1)//2; k2 = npoints//2 # middle rank(s), as np.median
+    filters = []; below = 0; ncandidates = npoints; lo = np.float64(vmin); hi = np.float64(vmax) # no integer overflow in hi-lo
+    median = None; limit = max(1, memory*2**20//8)
+    while median is None and ncandidates>limit and len(filters)<16:
+        histogram = np.zeros(nbins, dtype=np.int64); cmin = np.inf; cmax = -np.inf
+        for values in Candidates(img0, img1, memory, filters):
+            if len(filters)==0 and ybins.shape[0]>0: ybins += np.histogram(values, bins=xbins)[0]
+            if values.shape[0]==0: continue
+            histogram += np.bincount(BinIndex(values, lo, hi, nbins), minlength=nbins)
+            cmin = min(cmin, np.min(values)); cmax = max(cmax, np.max(values))
+        if cmin==cmax: median = float(cmin); break # all candidates equal
+        cumulative = np.cumsum(histogram)
+        b1 = np.searchsorted(cumulative, k1-below, side='right')
+        b2 = np.searchsorted(cumulative, k2-below, side='right')
+        below += cumulative[b1]-histogram[b1]; ncandidates = cumulative[b2]-below
+        filters.append((lo, hi, nbins, b1, b2))
+        width = (hi-lo)/nbins; lo, hi = lo+b1*width, lo+(b2+1)*width
+    if median is None:
+        candidates = []
+        for values in Candidates(img0, img1, memory, filters):
+            if len(filters)==0 and ybins.shape[0]>0: ybins += np.histogram(values, bins=xbins)[0]
+            candidates.append(values)
+        candidates = np.sort(np.concatenate(candidates)).astype(np.float64)
+        median = (candidates[k1-below]+candidates[k2-below])/2
+    ybins = np.resize (ybins,xbins.shape[0]); ybins[xbins.shape[0]-1]=0
+    return {'count':npoints, 'average':total/npoints, 'weighted':wtotal/wsum, 'median':median,
+            'minimum':vmin, 'maximum':vmax, 'xbins':xbins, 'ybins':ybins}
+
+
+#weight and value of the voxels with nonzero weight as two columns, sorted by
+#weight (stable, so equal weights stay sorted by value), order sorts the values
+def SortedTable(values, weights, order=None):
+    if order is None: order = values.argsort() # doesn't need to be stable
+    data = np.column_stack((values, weights))[order]
+    return data[data[:,1].argsort(kind='mergesort')]
+
+
+#writes the "(all)" table of the batch mode, named as in the interactive mode
+def WriteAll(data0, data1, args, dirname, basename0):
+    basename1 = os.path.splitext(os.path.basename(args.weights))[0]; basename1 = os.path.splitext(basename1)[0]
+    nonzero = data1!=0
+    data = SortedTable(data0[nonzero], data1[nonzero])
+    name = basename0.replace("_","")+"_versus_"+basename1.replace("_","")+"_(all)."+args.all_format
+    name = WriteTable (os.path.join(dirname,name), [data[:,1], data[:,0]], ['weight', 'value'])
+    print ('Table "(all)" written to '+name)
+
+
+#headless mode: with -l statistics of an image in all regions of a Label file,
+#otherwise the weighted voxel statistics and histogram, streamed slab by slab;
+#--all-format also writes the "(all)" table (needs the whole volumes in memory)
+def batch(argv):
+    parser = argparse.ArgumentParser(description='Statistics of a NIFTI image (e.g. FA) in all regions of a Label file (-l), '+
+                                     'or weighted by a second image, streamed in z-slabs for volumes larger than memory')
+    parser.add_argument('image', help='scalar NIFTI image (e.g. FA)')
+    parser.add_argument('weights', nargs='?', default=None, help='NIFTI image for the weighted average (e.g. fdt_paths), optional with -l')
+    parser.add_argument('-l', '--labels', default=None, help='Label file with regions 1..N (e.g. from NIFTI_Masks2Label)')
+    parser.add_argument('-o', '--output', default=None, help='output CSV file (default: <image>_versus_<labels>_(labels).csv, or <image>_Histogram.csv)')
+    parser.add_argument('-m', '--memory', type=int, default=256, help='memory ceiling in MB for the streamed statistics (default: 256)')
+    parser.add_argument('--all-format', choices=['csv','npy','npz','parquet'], default=None,
+                        help='also write the "(all)" table of weight and value of every weighted voxel in this format '
+                             '(parquet needs pyarrow, otherwise csv), loads both volumes completely')
+    args = parser.parse_args(argv)
+    basename0 = os.path.splitext(os.path.basename(args.image))[0]; basename0 = os.path.splitext(basename0)[0]
+    dirname = os.path.dirname(os.path.abspath(args.image))
+    if args.labels is None:
+       if args.weights is None: print ('ERROR: No weights image specified'); sys.exit(2)
+       img0 = nib.load(args.image, keep_file_open=True); img1 = nib.load(args.weights, keep_file_open=True) # .nii.gz: slabs without inflating from the start
+       if len(img0.shape) != 3 or len(img1.shape) != 3: print ('ERROR: Input is not a 3D NIFTI file'); sys.exit(2)
+       if img0.shape != img1.shape: print ("ERROR: Images must have same dimensions"); sys.exit(1)
+       stats = StreamStatistics(img0, img1, args.memory)
+       print ("Voxel Statistics:")
+       print ("  Simple average = ", stats['average'])
+       print ("  Weighted average = ", stats['weighted'])
+       print ("  Median  = ", stats['median'])
+       print ("  Minimum = ", stats['minimum'])
+       print ("  Maximum = ", stats['maximum'])
+       print ("  Number of voxels evaluated = ", stats['count'])
+       if args.output is None: args.output = os.path.join(dirname, basename0.replace("_","")+'_Histogram.csv')
+       with open(args.output, "w") as csv_file:
+          np.savetxt(csv_file, np.column_stack((stats['xbins'][:-2], stats['ybins'][:-2])), fmt='%e', delimiter=',')
+          csv_file.write("\n")
+       if args.all_format is not None: WriteAll(LoadNIFTI(args.image)[1], LoadNIFTI(args.weights)[1], args, dirname, basename0)
+       return
+    data0 = LoadNIFTI(args.image)[1]
+    labels = LoadNIFTI(args.labels)[1]
+    if len(data0.shape) != 3 or len(labels.shape) != 3: print ('ERROR: Input is not a 3D NIFTI file'); sys.exit(2)
+    if data0.shape != labels.shape: print ("ERROR: Images must have same dimensions"); sys.exit(1)
+    if labels.dtype.kind not in 'iu':
+       print ('Warning: Label file is not Integer, converting, please check results carefully')
+       labels = np.round(labels).astype(np.int32)
+    weights = None
+    if args.weights is not None:
+       weights = LoadNIFTI(args.weights)[1]
+       if weights.shape != data0.shape: print ("ERROR: Images must have same dimensions"); sys.exit(1)
+    stats = AtlasStatistics(data0, labels, weights)
+    if args.all_format is not None and weights is not None: WriteAll(data0, weights, args, dirname, basename0)
+    if args.output is None:
+       basename1 = os.path.splitext(os.path.basename(args.labels))[0]; basename1 = os.path.splitext(basename1)[0]
+       args.output = os.path.join(dirname, basename0.replace("_","")+"_versus_"+basename1.replace("_","")+"_(labels).csv")
+    with open(args.output, "w") as csv_file:
+       csv_file.write("Label,Voxel count,Average,Weighted average,Median,Minimum,Maximum\n")
+       for i in range (0,stats['label'].shape[0]):
+          csv_file.write("%d,%d,%e,%e,%e,%e,%e\n" % (stats['label'][i], stats['count'][i], stats['average'][i],
+                         stats['weighted'][i], stats['median'][i], stats['minimum'][i], stats['maximum'][i]))
+    print ("Statistics of "+str(stats['label'].shape[0])+" regions written to "+args.output)
+    
     
 #general initialization stuff  
 Program_name = os.path.basename(sys.argv[0]); 
 if Program_name.find('.')>0: Program_name = Program_name[:Program_name.find('.')]
 python_version=str(sys.version_info[0])+'.'+str(sys.version_info[1])+'.'+str(sys.version_info[2])
-# sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
-if sys.platform=="win32": os.system("title "+Program_name)
+
+if __name__ == '__main__':
+    #command line arguments given: run headless
+    if len(sys.argv)>1: batch (sys.argv[1:]); sys.exit(0)
+
+    TK_installed=True
+    try: from tkFileDialog import askopenfilename # Python 2
+    except: 
+        try: from tkinter.filedialog import askopenfilename; # Python3
+        except: TK_installed=False
+    try: import Tkinter as tk; # Python2
+    except: 
+        try: import tkinter as tk; # Python3
+        except: TK_installed=False
+    if not TK_installed:
+        print ('ERROR: tkinter not installed')
+        print ('       on Linux try "yum install tkinter"')
+        print ('       on MacOS install ActiveTcl from:')
+        print ('       http://www.activestate.com/activetcl/downloads')
+        sys.exit(2)
+
+    # sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
+    if sys.platform=="win32": os.system("title "+Program_name)
     
-#TK initialization       
-TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
-TKwindows.update()
-# the following tries to disable showing hidden files/folders under linux
-try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
-except: pass
-try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
-except: pass
-TKwindows.update()
+    #TK initialization       
+    TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
+    TKwindows.update()
+    # the following tries to disable showing hidden files/folders under linux
+    try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
+    except: pass
+    try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
+    except: pass
+    TKwindows.update()
     
-#intercatively choose first input file
-FIDfile0 = askopenfilename(title="Choose first NIFTI file (e.g. FA)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
-if FIDfile0=="": print ('ERROR: No input file specified'); sys.exit(2)
-FIDfile = os.path.abspath(FIDfile0)
-img0 = nib.load(FIDfile0)
-data0 = np.asanyarray(img0.dataobj)
-if len(data0.shape) != 3:print ('ERROR: Input is not a 3D NIFTI file'); sys.exit(2) 
-if np.max(data0)>10: print ('ERROR: Input file does not look like a Diffusion Image'); sys.exit(2)
-
-#intercatively choose second input file
-FIDfile1 = askopenfilename(title="Choose second NIFTI file (for weighting)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
-if FIDfile1=="": print ('ERROR: No input file specified'); sys.exit(2)
-FIDfile1 = os.path.abspath(FIDfile1)
-img1 = nib.load(FIDfile1)
-data1 = np.asanyarray(img1.dataobj)
-if len(data1.shape) != 3:print ('ERROR: Input is not a 3D NIFTI file'); sys.exit(2) 
+    #intercatively choose first input file
+    FIDfile0 = askopenfilename(title="Choose first NIFTI file (e.g. FA)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
+    if FIDfile0=="": print ('ERROR: No input file specified'); sys.exit(2)
+    FIDfile = os.path.abspath(FIDfile0)
+    img0, data0 = LoadNIFTI(FIDfile0)
+    if len(data0.shape) != 3:print ('ERROR: Input is not a 3D NIFTI file'); sys.exit(2) 
+    if np.max(data0)>10: print ('ERROR: Input file does not look like a Diffusion Image'); sys.exit(2)
+
+    #intercatively choose second input file
+    FIDfile1 = askopenfilename(title="Choose second NIFTI file (for weighting)", filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
+    if FIDfile1=="": print ('ERROR: No input file specified'); sys.exit(2)
+    FIDfile1 = os.path.abspath(FIDfile1)
+    img1, data1 = LoadNIFTI(FIDfile1)
+    if len(data1.shape) != 3:print ('ERROR: Input is not a 3D NIFTI file'); sys.exit(2) 
    
-TKwindows.update()
-try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
-except: pass #silent
+    TKwindows.update()
+    try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
+    except: pass #silent
+
+    #names based on first file
+    dirname  = os.path.dirname(FIDfile0)
+    basename0 = os.path.splitext(os.path.basename(FIDfile0))[0]; basename0 = os.path.splitext(basename0)[0]
+    basename1 = os.path.splitext(os.path.basename(FIDfile1))[0]; basename1 = os.path.splitext(basename1)[0]
+
+    #dimension verification
+    if data0.shape != data1.shape: print ("ERROR: Images must have same dimensions"); sys.exit(1)
+
+    #extract the voxels with nonzero weight once, all statistics are derived from these
+    nonzero = data1!=0
+    values = data0[nonzero]; weights = data1[nonzero]
+    positive = weights>0
+    if not np.all(positive): values_positive = values[positive]
+    else: values_positive = values
+    #sort by value, used for the median and again for the tables below
+    order = values.argsort() # doesn't need to be stable
+    if values_positive is values: sorted_positive = values[order]
+    else: sorted_positive = values[order][positive[order]]
+    npoints = values_positive.shape[0]
+    vmin = np.min(values_positive); vmax = np.max(values_positive)
+
+    #calculate
+    print ("Voxel Statistics:")
+    print ("  Simple average = ", np.average(values_positive))
+    print ("  Weighted average = ", np.average(values, weights=weights))
+    print ("  Median  = ", np.mean(sorted_positive[(npoints-1)//2:npoints//2+1])) # as np.median
+    print ("  Minimum = ", vmin)
+    print ("  Maximum = ", vmax)
+    print ("  Number of voxels evaluated = ", npoints)
+    print ("")
+
+    '''
+    print ("Voxel Statistics corrected (0<FA<=1")
+    data0 = data0[data1>0]
+    data1 = data1[data1>0]
+    data1 = data1[data0>0]
+    data0 = data0[data0>0]
+    data1 = data1[data0<=1]
+    data0 = data0[data0<=1]
+    print ("")
+    print ("  Simple average = ", np.average(data0[data1>0]))
+    print ("  Weighted average = ", np.average(data0, weights=data1))
+    print ("  Median  = ", np.median(data0[data1>0]))
+    print ("  Minimum = ", np.min(data0[data1>0]))
+    print ("  Maximum = ", np.max(data0[data1>0]))
+    print ("  Number of voxels evaluated = ", data1[data1>0].shape[0])
+    print ("")
+    '''
+
+    #calculate histogram
+    steps = int(np.sqrt(npoints)) 
+    start = vmin
+    fin   = vmax
+    xbins =  np.linspace(start,fin,steps)
+    ybins, binedges = np.histogram(values_positive, bins=xbins)
+    ybins = np.resize (ybins,len(xbins)); ybins[len(ybins)-1]=0
+
+    #write histogram results
+    with open(os.path.join(dirname,basename0.replace("_","")+'_Histogram.csv'), "w") as csv_file:    
+        np.savetxt(csv_file, np.column_stack((xbins[:-2], ybins[:-2])), fmt='%e', delimiter=',')
+        csv_file.write("\n")  
+
+
+    #join arrays (zero weights already removed) and sort by weight
+    data = SortedTable(values, weights, order)
+
+    #write (1 versus 0) table (all)
+    name=basename0.replace("_","")+"_versus_"+basename1.replace("_","")+"_(all).csv"
+    WriteTable (os.path.join(dirname,name), [data[:,1], data[:,0]], ['weight', 'value'])
+
+    #remove more zeros
+    zero_idx = np.where(data[:,0]==0); 
+    data = np.delete (data,zero_idx, axis=0)
+
+    #reduce array size
+    #data is sorted by weight, so every weight value is a contiguous group of rows
+    #from every xreduce-th group (and every small group) about ytarget rows are kept
+    ytarget = 10
+    xtarget = 20
+    data = data[~np.isnan(data[:,1])] # NaN weights never matched a group
+    if data.shape[0]>0: starts = np.concatenate(([0], np.flatnonzero(data[1:,1]!=data[:-1,1])+1))
+    else: starts = np.zeros(0, dtype=np.int64)
+    counts = np.diff(np.append(starts, data.shape[0]))
+    xreduce = max(1,int(starts.shape[0]/xtarget))
+    selected = (np.arange(starts.shape[0]) % xreduce == 0) | (counts<ytarget)
+    starts = starts[selected]; counts = counts[selected]
+    yreduce = np.where(counts>2*ytarget, counts//ytarget, 1)
+    nkeep = (counts+yreduce-1)//yreduce # rows of temp[::yreduce]
+    group = np.repeat(np.arange(starts.shape[0]), nkeep)
+    step = np.arange(group.shape[0]) - np.repeat(np.cumsum(nkeep)-nkeep, nkeep)
+    data_reduced = data[starts[group]+step*yreduce[group]]
+    data_reduced = data_reduced.astype(np.result_type(data_reduced.dtype, np.int_)) # as the former append to an integer array
+
+    #further reduce array size randomly
+    if data_reduced.shape[0]>5000:
+      numbers = np.arange(data_reduced.shape[0]); np.random.shuffle(numbers)
+      numbers = numbers[0:5000]
+      data_reduced = data_reduced[numbers,:]
+      #sort data again
+      data_reduced = data_reduced[data_reduced[:,0].argsort()] # First sort doesn't need to be stable.
+      data_reduced = data_reduced[data_reduced[:,1].argsort(kind='mergesort')]
 
-#names based on first file
-dirname  = os.path.dirname(FIDfile0)
-basename0 = os.path.splitext(os.path.basename(FIDfile0))[0]; basename0 = os.path.splitext(basename0)[0]
-basename1 = os.path.splitext(os.path.basename(FIDfile1))[0]; basename1 = os.path.splitext(basename1)[0]
-
-#dimension verification
-if data0.shape != data1.shape: print ("ERROR: Images must have same dimensions"); sys.exit(1)
-
-#calculate
-print ("Voxel Statistics:")
-print ("  Simple average = ", np.average(data0[data1>0]))
-print ("  Weighted average = ", np.average(data0, weights=data1))
-print ("  Median  = ", np.median(data0[data1>0]))
-print ("  Minimum = ", np.min(data0[data1>0]))
-print ("  Maximum = ", np.max(data0[data1>0]))
-print ("  Number of voxels evaluated = ", data0[data1>0].shape[0])
-print ("")
-
-'''
-print ("Voxel Statistics corrected (0<FA<=1")
-data0 = data0[data1>0]
-data1 = data1[data1>0]
-data1 = data1[data0>0]
-data0 = data0[data0>0]
-data1 = data1[data0<=1]
-data0 = data0[data0<=1]
-print ("")
-print ("  Simple average = ", np.average(data0[data1>0]))
-print ("  Weighted average = ", np.average(data0, weights=data1))
-print ("  Median  = ", np.median(data0[data1>0]))
-print ("  Minimum = ", np.min(data0[data1>0]))
-print ("  Maximum = ", np.max(data0[data1>0]))
-print ("  Number of voxels evaluated = ", data1[data1>0].shape[0])
-print ("")
-'''
-
-#calculate histogram
-npoints = np.prod(data0[data1>0].shape)
-steps = int(np.sqrt(npoints)) 
-start = np.min(data0[data1>0])
-fin   = np.max(data0[data1>0])
-xbins =  np.linspace(start,fin,steps)
-ybins, binedges = np.histogram(data0[data1>0], bins=xbins)
-ybins = np.resize (ybins,len(xbins)); ybins[len(ybins)-1]=0
-
-#write histogram results
-with open(os.path.join(dirname,basename0.replace("_","")+'_Histogram.csv'), "w") as csv_file:    
-    for i in range(0,xbins.shape[0]-2):     
-        csv_file.write("%e,%e\n" % (xbins[i], ybins[i]))
-    csv_file.write("\n")  
-
-
-#join arrays
-data0 = data0.flatten(); data1 = data1.flatten();
-nz = np.nonzero(data1); data0 = data0[nz]; data1 = data1[nz] # remove zeros
-data=np.column_stack((data0, data1))
-
-#sort data
-data = data[data[:,0].argsort()] # First sort doesn't need to be stable.
-data = data[data[:,1].argsort(kind='mergesort')]
-
-#write (1 versus 0) csv (all)
-name=basename0.replace("_","")+"_versus_"+basename1.replace("_","")+"_(all).csv"
-csv=open(os.path.join(dirname,name), "w")
-for i in range (0,data.shape[0]): csv.write (str(data[i,1])+","+str(data[i,0])+"\n")
-csv.close()
-
-#remove more zeros
-zero_idx = np.where(data[:,0]==0); 
-data = np.delete (data,zero_idx, axis=0)
-
-#reduce array size
-data_reduced=np.asarray([[0,0],[0,0]]) #initialize with correct shape
-un1 = np.unique(data[:,1])
-ytarget = 10
-xtarget = 20
-xreduce = int(un1.shape[0]/xtarget)
-for i in range (0,un1.shape[0]):
-    temp=data[data[:,1]==un1[i]]
-    if i % xreduce == 0 or temp.shape[0]<ytarget:
-      if temp.shape[0]>2*ytarget:
-        yreduce=int(temp.shape[0]/ytarget)
-      else:
-        yreduce=1
-      new_entry = np.asarray (temp[::yreduce,:])   
-      data_reduced = np.append(data_reduced,new_entry,axis=0) 
-data_reduced = data_reduced[2:,:] # remove initialize values with correct shape
-
-#further reduce array size randomly
-if data_reduced.shape[0]>5000:
-  numbers = np.arange(data_reduced.shape[0]); np.random.shuffle(numbers)
-  numbers = numbers[0:5000]
-  data_reduced = data_reduced[numbers,:]
-  #sort data again
-  data_reduced = data_reduced[data_reduced[:,0].argsort()] # First sort doesn't need to be stable.
-  data_reduced = data_reduced[data_reduced[:,1].argsort(kind='mergesort')]
-
-#write (1 versus 0) csv (reduced)
-name=basename0.replace("_","")+"_versus_"+basename1.replace("_","")+"_(reduced).csv"
-csv=open(os.path.join(dirname,name), "w")
-for i in range (0,data_reduced .shape[0]): csv.write (str(data_reduced [i,1])+","+str(data_reduced [i,0])+"\n")
-csv.close()
+    #write (1 versus 0) csv (reduced)
+    name=basename0.replace("_","")+"_versus_"+basename1.replace("_","")+"_(reduced).csv"
+    csv=open(os.path.join(dirname,name), "w")
+    for i in range (0,data_reduced .shape[0]): csv.write (str(data_reduced [i,1])+","+str(data_reduced [i,0])+"\n")
+    csv.close()
    
      
-#end
-if sys.platform=="win32": os.system("pause") # windows
-else: 
-    #os.system('read -s -n 1 -p "Press any key to continue...\n"')
-    import termios
-    print("Press any key to continue...")
-    fd = sys.stdin.fileno()
-    oldterm = termios.tcgetattr(fd)
-    newattr = termios.tcgetattr(fd)
-    newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
-    termios.tcsetattr(fd, termios.TCSANOW, newattr)
-    try: result = sys.stdin.read(1)
-    except IOError: pass
-    finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
+    #end
+    if sys.platform=="win32": os.system("pause") # windows
+    else: 
+        #os.system('read -s -n 1 -p "Press any key to continue...\n"')
+        import termios
+        print("Press any key to continue...")
+        fd = sys.stdin.fileno()
+        oldterm = termios.tcgetattr(fd)
+        newattr = termios.tcgetattr(fd)
+        newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
+        termios.tcsetattr(fd, termios.TCSANOW, newattr)
+        try: result = sys.stdin.read(1)
+        except IOError: pass
+        finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+#
+# this is a subroutine for reading NIFTI files, shared by the NIFTI tools:
+# uncompressed .nii files are memory-mapped (no copy), block gzip files (BGZF,
+# e.g. written with bgzip or WriteNIFTI) are inflated on several threads, other
+# .nii.gz files are read in one go and inflated with isal straight into the data
+# buffer if isal is installed (with zlib nibabel is as fast); scaled data
+# (scl_slope/scl_inter) and anything unusual is left to nibabel
+#
+import sys
+import os
+import time
+import logging
+import numpy as np
+import nibabel as nib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+try: from isal import isal_zlib as zlib; ISAL = True # 2-3x faster inflate
+except ImportError: import zlib; ISAL = False
+
+
+#compressed block sizes of a BGZF file (None if it is not one), from the
+#BSIZE field of the 'BC' extra subfield in every gzip member header
+def BGZFBlocks (raw):
+   blocks = []; pos = 0
+   while pos < len(raw):
+      if raw[pos:pos+4] != b'\x1f\x8b\x08\x04': return None # not gzip with FEXTRA
+      xlen = raw[pos+10] | raw[pos+11]<<8
+      extra = raw[pos+12:pos+12+xlen]; bsize = None; k = 0
+      while k+4 <= len(extra):
+         slen = extra[k+2] | extra[k+3]<<8
+         if extra[k:k+2]==b'BC' and slen==2: bsize = (extra[k+4] | extra[k+5]<<8)+1
+         k += 4+slen
+      if bsize is None: return None
+      blocks.append((pos, 12+xlen, bsize)); pos += bsize
+   return blocks
+
+
+#inflates the gzip file content raw into out (a writable buffer of the final
+#size, data beyond it is dropped), BGZF blocks on threads
+def Inflate (raw, out, threads=None):
+   view = memoryview(out); size = len(out)
+   blocks = BGZFBlocks(raw)
+   if blocks is not None and len(blocks)>1:
+      offsets = [0]
+      for pos, header, bsize in blocks: # ISIZE trailer: uncompressed size of the block
+         offsets.append(offsets[-1] + int.from_bytes(raw[pos+bsize-4:pos+bsize], 'little'))
+      raw = memoryview(raw)
+      def inflate (k):
+         if offsets[k] >= size: return
+         pos, header, bsize = blocks[k]
+         data = zlib.decompress(raw[pos+header:pos+bsize-8], -15)
+         n = min(len(data), size-offsets[k]); view[offsets[k]:offsets[k]+n] = data[:n]
+      if threads is None: threads = os.cpu_count() or 1
+      with ThreadPoolExecutor(max_workers=max(1,threads)) as executor: list(executor.map(inflate, range(len(blocks)), chunksize=64))
+      return min(offsets[-1], size)
+   n = 0; pos = 0; raw = memoryview(raw)
+   while pos < len(raw) and n < size: # (multi member) gzip, pos: start of the member
+      d = zlib.decompressobj(31); start = pos
+      while start < len(raw) and not d.eof and n < size:
+         data = d.decompress(raw[start:start+2**24]); start += 2**24
+         m = min(len(data), size-n); view[n:n+m] = data[:m]; n += m
+      if not d.eof: break
+      pos = min(start, len(raw))-len(d.unused_data) # the next member
+   return n
+
+
+#data array of a loaded image: memory-mapped for uncompressed files (by
+#nibabel), inflated in one go for unscaled BGZF files (and any .nii.gz file
+#with isal), nibabel otherwise
+def ReadData (img, threads=None):
+   proxy = img.dataobj
+   filename = getattr(proxy, 'file_like', None)
+   if not isinstance(filename, str) or not filename.endswith('.gz') or \
+      getattr(proxy, 'slope', None)!=1 or getattr(proxy, 'inter', None)!=0 or getattr(proxy, 'order', 'F')!='F':
+      return np.asanyarray(proxy)
+   shape = proxy.shape; dtype = np.dtype(proxy.dtype); offset = proxy.offset
+   with open(filename, 'rb') as f:
+      if not ISAL and BGZFBlocks(f.read(18)) is None: return np.asanyarray(proxy) # no copy of the file
+      f.seek(0); raw = f.read()
+   out = bytearray(offset + int(np.prod(shape))*dtype.itemsize)
+   if Inflate(raw, out, threads) < len(out): raise ValueError('NIFTI file '+filename+' is truncated')
+   return np.frombuffer(out, dtype=dtype, offset=offset, count=int(np.prod(shape))).reshape(shape, order='F')
+
+
+#loads a NIFTI file, returns the image and its data
+def LoadNIFTI (NIFTIfile, threads=None):
+   img = nib.load(NIFTIfile, mmap='c')
+   return img, ReadData(img, threads)
+
+
+#loads a NIFTI image with error handling "abort", "warn" or "ignore",
+#log (if given) gets the abort message
+def ReadNIFTI (NIFTIfile, logfilename, error_handling, log=None):
+   if error_handling == "ignore": logging.basicConfig(filename=os.devnull)
+   else: logging.basicConfig(filename=logfilename)
+   if error_handling == "abort": # -----> abort on warning/error write msg to screen/logfile
+      nib.imageglobals.error_level = 30  #rise an error
+      try:
+         with nib.imageglobals.LoggingOutputSuppressor(): # supresss onscreen message
+            return nib.load(NIFTIfile, mmap='c')
+      except Exception as err:
+         print ("Error reading NIFTI file: "+str(err)) # custom handle error message
+         if log is not None: log.write ("Operation aborted\n"); log.flush()
+         sys.exit(2)
+   elif error_handling == "warn": # -----> continue on warning/error write msg to screen/logfile
+      try: return nib.load(NIFTIfile, mmap='c')
+      except Exception as err:
+         print ("Error reading NIFTI file:", err);
+         sys.exit(2)
+   elif error_handling == "ignore": # -----> continue silently
+      with nib.imageglobals.LoggingOutputSuppressor(): # supresss onscreen message
+         return nib.load(NIFTIfile, mmap='c')
+   else: print ("Unknown error handling mode", error_handling); sys.exit(0)
+
+
+#read-ahead: decodes the next nahead files on worker threads while the current
+#one is processed, yields (img, data) in the original order
+def ReadAhead (NIFTIfiles, logfilename, error_handling, nahead=4, log=None):
+   def read (NIFTIfile):
+      img = ReadNIFTI(NIFTIfile, logfilename, error_handling, log)
+      return img, ReadData(img, threads=1) # files are already decoded in parallel
+   with ThreadPoolExecutor(max_workers=max(1,nahead)) as executor:
+      pending = deque()
+      for NIFTIfile in NIFTIfiles:
+         pending.append(executor.submit(read, NIFTIfile))
+         if len(pending)>nahead: yield pending.popleft().result()
+      while len(pending)>0: yield pending.popleft().result()
+
+
+#example usage
+#
+#from ReadNIFTI import LoadNIFTI
+#img, data = LoadNIFTI('fdt_paths.nii.gz')
+
+
+#benchmark on a 256^3 float32 volume against plain nibabel
+#usage: python ReadNIFTI.py [directory for the temporary files]
+if __name__ == '__main__':
+   import tempfile
+   def timeit (function, repeats=3):
+      best = float('inf')
+      for n in range (0,repeats):
+         start = time.perf_counter(); function(); best = min(best, time.perf_counter()-start)
+      return best
+   folder = tempfile.mkdtemp(dir=sys.argv[1] if len(sys.argv)>1 else None)
+   data = np.zeros((256,256,256), dtype=np.float32)
+   data[64:192,48:208,80:176] = np.random.random((128,160,96))
+   img = nib.Nifti1Image(data, np.eye(4))
+   files = [os.path.join(folder,'test.nii'), os.path.join(folder,'test.nii.gz')]
+   for filename in files: nib.save(img, filename)
+   from WriteNIFTI import BlockGzip # the same data as BGZF, 64k blocks as bgzip
+   with open(files[0],'rb') as f: raw = f.read()
+   files.append(os.path.join(folder,'test_bgzf.nii.gz'))
+   with open(files[-1],'wb') as f: f.write(BlockGzip(raw))
+   print ("256x256x256 float32, best of 3, %s inflate:" % zlib.__name__)
+   for filename in files:
+      assert np.array_equal(LoadNIFTI(filename)[1], data)
+      old = timeit(lambda: np.asanyarray(nib.load(filename).dataobj).sum())
+      new = timeit(lambda: LoadNIFTI(filename)[1].sum())
+      print ("  %-18s nibabel %8.1f ms   ReadNIFTI %8.1f ms   %6.1fx" % (os.path.basename(filename), old*1000, new*1000, old/new))
+   for filename in files: os.remove(filename)
+   os.rmdir(folder)
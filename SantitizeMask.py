@@ -0,0 +1,67 @@
+#!/usr/bin/python
+#
+# this is a subroutine to sanity check/correct Mask data (should contain only 0 and 1)
+# shared by the NIFTI tools, clean masks are detected in O(n) without sorting,
+# only other masks go through the (np.unique based) thresholding
+#
+import time
+import numpy as np
+
+
+#True if data contains exactly the values 0 and 1
+def IsCleanMask (data, chunk=65536):
+   if data.size==0: return False
+   if data.dtype.kind in 'biu': # integer: min 0 and max 1 leaves no other value
+      return data.min()==0 and data.max()==1
+   flat = data.ravel(order='K')
+   zero = False; one = False
+   for k in range (0,flat.shape[0],chunk): # float: cache sized chunks, no full size temporaries
+      part = flat[k:k+chunk]
+      if np.any((part!=0)&(part!=1)): return False
+      if not zero: zero = part.min()==0
+      if not one: one = part.max()==1
+   return zero and one
+
+
+#sanity check/correct Mask data, warnings are also written to log (if given)
+def SantitizeMask (data, log=None):
+   if IsCleanMask(data): return data
+   if np.unique(data).shape[0]!=2: # more than two values present
+      data[data<0] = 0
+      thresh = np.average (data[data>0])
+      print ("Warning: Mask contains more then two different values, trying to fix")
+      if log is not None: log.write("Warning: Mask contains more then two different values, trying to fix\n"); log.flush()
+      data[data<=thresh]=0; data[data>thresh]=1
+   else: # only two values present, easily corrected
+      print ("Warning: Mask contains values!=[0,1], trying to fix")
+      if log is not None: log.write("Warning: Mask contains values!=[0,1], trying to fix\n"); log.flush()
+      data[data==np.min(data)]=0; data[data==np.max(data)]=1
+   return data
+
+
+#micro-benchmark on 256^3 volumes against the former np.unique based check
+#usage: python SantitizeMask.py
+if __name__ == '__main__':
+   def SantitizeMask_unique (data):
+      if not np.array_equal(np.unique(data), np.asarray([0,1])):
+         if np.unique(data).shape[0]!=2:
+            data[data<0] = 0
+            thresh = np.average (data[data>0])
+            data[data<=thresh]=0; data[data>thresh]=1
+         else:
+            data[data==np.min(np.unique(data))]=0; data[data==np.max(np.unique(data))]=1
+      return data
+   def timeit (function, data, repeats=3):
+      best = float('inf')
+      for n in range (0,repeats):
+         start = time.perf_counter(); function(data); best = min(best, time.perf_counter()-start)
+      return best
+   shape = (256,256,256)
+   mask = np.zeros(shape, dtype=np.uint8)
+   mask[64:192,48:208,80:176] = 1
+   print ("Clean 0/1 mask, %dx%dx%d, best of 3:" % shape)
+   for dtype in (np.uint8, np.int16, np.float32):
+      data = mask.astype(dtype)
+      old = timeit(SantitizeMask_unique, data)
+      new = timeit(SantitizeMask, data)
+      print ("  %-8s np.unique %8.1f ms   fast path %8.1f ms   %6.1fx" % (np.dtype(dtype).name, old*1000, new*1000, old/new))
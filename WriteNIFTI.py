@@ -0,0 +1,121 @@
+#!/usr/bin/python
+#
+# this is a subroutine for writing NIFTI files, shared by the NIFTI tools:
+# the header gets the geometry of the original image (affine, sform/qform,
+# xyzt units) as before, optionally the data is stored in the smallest integer
+# type holding its values (uint8 for masks), .nii.gz files can be written with
+# a chosen gzip level or as block gzip (BGZF, compressed on several threads,
+# inflated in parallel by ReadNIFTI), saves can run on a background thread
+#
+import os
+import struct
+import zlib
+import numpy as np
+import nibabel as nib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+#new image of data with the geometry of the original header
+def NIFTIImage (data, affine, header):
+   sform = int(header['sform_code'])
+   qform = int(header['qform_code'])
+   unit_xyz, unit_t = header.get_xyzt_units()
+   if unit_xyz == 'unknown': unit_xyz=0
+   if unit_t   == 'unknown': unit_t=0
+   img_SoS = nib.Nifti1Image(data, affine)
+   img_SoS.header.set_xyzt_units(unit_xyz, unit_t)
+   img_SoS.set_sform(affine, code=sform)
+   img_SoS.set_qform(affine, code=qform)
+   img_SoS.header.set_slope_inter(1,0)
+   #duno if this is needed
+   img_SoS.header['cal_max']=np.max(data)
+   img_SoS.header['extents']=np.min(data)
+   img_SoS.header['regular']=header['regular']
+   img_SoS.header['scl_slope']=1
+   img_SoS.header['scl_inter']=0
+   img_SoS.header['glmax']=np.max(data)
+   img_SoS.header['glmin']=np.min(data)
+   return img_SoS
+
+
+#smallest integer type holding all values of integer (or boolean) data,
+#float data keeps its type
+def SmallestType (data):
+   if data.dtype.kind == 'b': return np.dtype(np.uint8)
+   if data.dtype.kind not in 'iu' or data.size==0: return data.dtype
+   vmin = int(np.min(data)); vmax = int(np.max(data))
+   for dtype in (np.uint8, np.int8, np.uint16, np.int16, np.int32, np.int64):
+      if np.iinfo(dtype).min <= vmin and vmax <= np.iinfo(dtype).max: return np.dtype(dtype)
+   return data.dtype
+
+
+#gzip content of raw as BGZF blocks (as bgzip: 64k blocks, 'BC' extra field,
+#empty EOF block), the blocks are compressed on threads (zlib releases the GIL)
+def BlockGzip (raw, level=6, threads=None, blocksize=65280):
+   view = memoryview(raw)
+   def compress (start):
+      block = view[start:start+blocksize]; c = zlib.compressobj(level, zlib.DEFLATED, -15)
+      cdata = c.compress(block)+c.flush()
+      return (b'\x1f\x8b\x08\x04\0\0\0\0\0\xff\x06\0BC\x02\0'+struct.pack('<H', len(cdata)+25)+cdata+
+              struct.pack('<II', zlib.crc32(block) & 0xffffffff, len(block)))
+   if threads is None: threads = os.cpu_count() or 1
+   with ThreadPoolExecutor(max_workers=max(1,threads)) as executor:
+      blocks = list(executor.map(compress, range(0, len(raw), blocksize)))
+   return b''.join(blocks)+compress(len(raw)) # EOF block
+
+
+#writes data with the geometry of the original header, dtype: None keeps the
+#type of data, 'smallest' uses SmallestType; for .nii.gz files level is the
+#gzip level (None: nibabel's default), blocks=True writes BGZF on threads
+def WriteNIFTI (data, affine, header, filename, dtype=None, level=None, blocks=False, threads=None):
+   if dtype == 'smallest': dtype = SmallestType(data)
+   if dtype is not None and np.dtype(dtype) != data.dtype: data = data.astype(dtype)
+   img_SoS = NIFTIImage(data, affine, header)
+   if not filename.endswith('.gz') or (level is None and not blocks):
+      nib.save(img_SoS, filename); return
+   raw = img_SoS.to_bytes()
+   if level is None: level = 6
+   if blocks: compressed = BlockGzip(raw, level, threads)
+   else:
+      c = zlib.compressobj(level, zlib.DEFLATED, 31) # gzip wrapper, no name/mtime
+      compressed = c.compress(raw)+c.flush()
+   with open(filename, 'wb') as f: f.write(compressed)
+
+
+#background saving: save(...) takes the arguments of WriteNIFTI and returns
+#at once while the file is written on a worker thread; with more than nqueue
+#saves pending it waits for the oldest (bounded memory), wait() waits for all;
+#errors are raised by the save/wait call that collects them
+def BackgroundSaver (nqueue=4, threads=1):
+   executor = ThreadPoolExecutor(max_workers=max(1,threads))
+   pending = deque()
+   def save (*args, **kwargs):
+      pending.append(executor.submit(WriteNIFTI, *args, **kwargs))
+      while len(pending)>nqueue: pending.popleft().result()
+   def wait ():
+      try:
+         while len(pending)>0: pending.popleft().result()
+      finally: executor.shutdown()
+   return save, wait
+
+
+#command line options of the tools for WriteNIFTI
+def AddWriteOptions (parser):
+   parser.add_argument('--dtype', choices=['keep','smallest'], default='keep',
+                       help='data type of the output files: as now, or the smallest integer type (uint8 for masks) (default: %(default)s)')
+   parser.add_argument('--level', type=int, choices=range(0,10), default=None, metavar='0-9',
+                       help='gzip level of .nii.gz output files (default: nibabel default)')
+   parser.add_argument('--bgzf', action='store_true',
+                       help='write .nii.gz output files as block gzip, compressed on all cores')
+
+
+#keyword arguments of WriteNIFTI from the command line options
+def WriteOptions (args):
+   return {'dtype': 'smallest' if args.dtype=='smallest' else None, 'level': args.level, 'blocks': args.bgzf}
+
+
+#example usage
+#
+#from WriteNIFTI import WriteNIFTI
+#WriteNIFTI(mask, img0.affine, img0.header, 'mask.nii.gz', dtype='smallest', level=6)
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+#
+# this is a subroutine for writing large numeric tables (one array per column)
+# as CSV in chunks with vectorized formatting (same numbers as str() gives for
+# the numpy values), or in a binary columnar format: .npy, .npz or .parquet
+# (parquet needs pyarrow, otherwise .csv is written instead)
+#
+import os
+import numpy as np
+
+
+#str() of every value, each distinct value is formatted only once
+def FormatColumn (x):
+   x = np.ascontiguousarray(x)
+   if x.dtype.kind not in 'fiub': return x.astype(str)
+   # unique on the bit pattern, keeps -0.0 apart from 0.0
+   values, inverse = np.unique(x.view('u%d' % x.itemsize), return_inverse=True)
+   return values.view(x.dtype).astype(str)[inverse.reshape(-1)]
+
+
+#writes the columns as comma separated lines, chunk rows at a time
+def WriteCSV (filename, columns, chunk=100000):
+   nrows = columns[0].shape[0]
+   with open(filename, "w") as csv_file:
+      for start in range (0,nrows,chunk):
+         lines = FormatColumn(columns[0][start:start+chunk])
+         for column in columns[1:]:
+            lines = np.char.add(np.char.add(lines, ','), FormatColumn(column[start:start+chunk]))
+         csv_file.write("\n".join(lines.tolist())+"\n")
+
+
+#writes the columns in the format given by the extension of filename,
+#returns the name of the file written
+def WriteTable (filename, columns, names):
+   ext = os.path.splitext(filename)[1].lower()
+   if ext == '.parquet':
+      try: import pyarrow, pyarrow.parquet
+      except ImportError:
+         print ("Warning: pyarrow not installed, writing .csv instead of .parquet")
+         filename = os.path.splitext(filename)[0]+'.csv'; ext = '.csv'
+      else:
+         pyarrow.parquet.write_table(pyarrow.table(dict(zip(names, columns))), filename)
+         return filename
+   if ext == '.npy': np.save(filename, np.column_stack(columns))
+   elif ext == '.npz': np.savez(filename, **dict(zip(names, columns)))
+   else: WriteCSV(filename, columns)
+   return filename
+
+
+#example usage
+#
+#from WriteTable import WriteTable
+#WriteTable('table.npz', [weights, values], ['weight', 'value'])
@@ -10,6 +10,17 @@
 # Version 0.1 - 08, May 2020
 #       - 1st public github Release
 #
+# Version 0.2 - 18, October 2026
+#       - headless batch mode for many files on a process pool,
+#         automatic, fixed (-t) or percentile (-p) threshold, summary table
+#       - exact bincount histogram for integer tract counts, statistics and
+#         histogram cached in a _Histogram.npz sidecar (size, mtime, sha1)
+#       - split from one threshold mask without full copies, both files
+#         written concurrently, optionally only _high or a uint8 _mask (-w)
+#       - NIFTI files read with the shared loader (ReadNIFTI.py)
+#       - NIFTI files written with the shared writer (WriteNIFTI.py), options
+#         --dtype smallest, --level and --bgzf
+#
 # ----- LICENSE -----                 
 #
 #    This program is free software: you can redistribute it and/or modify
@@ -41,179 +52,318 @@ try: import win32gui, win32console
 except: pass #silent
 import sys
 import os
+import argparse
+import glob
+import multiprocessing
 import numpy as np
-import nibabel as nib
 from InputFloat import InputFloat
+from ReadNIFTI import LoadNIFTI
+from Cache import FileHash, CacheValid
+from WriteNIFTI import WriteNIFTI, BackgroundSaver, AddWriteOptions, WriteOptions
 import warnings 
 warnings.filterwarnings("ignore") # disable numpy runtime warnings
 
-TK_installed=True
-try: from tkFileDialog import askopenfilename # Python 2
-except: 
-    try: from tkinter.filedialog import askopenfilename; # Python3
-    except: TK_installed=False
-try: import Tkinter as tk; # Python2
-except: 
-    try: import tkinter as tk; # Python3
-    except: TK_installed=False
-if not TK_installed:
-    print ('ERROR: tkinter not installed')
-    print ('       on Linux try "yum install tkinter"')
-    print ('       on MacOS install ActiveTcl from:')
-    print ('       http://www.activestate.com/activetcl/downloads')
-    sys.exit(2)
-
 def smooth(x,window_len):
     w=np.hanning(window_len)
     s=np.r_[2*x[0]-x[window_len-1::-1],x,2*x[-1]-x[-1:-window_len:-1]]
     w=np.hanning(window_len)
     y=np.convolve(w/w.sum(),s,mode='same')
     return y[window_len:-window_len+1]    
+
+
+#log spaced histogram of the number of tracts per voxel
+def Histogram(data1):
+    steps = int(np.sqrt(np.prod(data1.shape))) 
+    start = np.min(data1[np.nonzero(data1)])
+    fin   = np.max(data1)
+    #xbins =  np.linspace(start,fin,steps)
+    xbins =  np.unique(np.logspace(np.log10(start),np.log10(fin),steps).astype(int))
+    ybins, binedges = np.histogram(data1, bins=xbins)
+    ybins = np.resize (ybins,len(xbins)); ybins[len(ybins)-1]=0
+    return xbins, ybins
+
+
+#the sorted value at rank k (0 based) of the values given with their counts
+def CountRank(values, cumulative, k):
+    return values[np.searchsorted(cumulative, k, side='right')]
+
+
+#percentile (linear interpolation, as np.percentile) of the nonzero voxels
+#from the value counts of an integer volume
+def CountPercentile(values, counts, q):
+    positive = values>0
+    values = values[positive]; cumulative = np.cumsum(counts[positive])
+    rank = q/100.*(cumulative[-1]-1); k = int(np.floor(rank))
+    low = CountRank(values, cumulative, k); high = CountRank(values, cumulative, min(k+1,cumulative[-1]-1))
+    return low+(high-low)*(rank-k)
+
+
+#tract statistics (minimum, average, median, maximum) and histogram of a volume,
+#integer tract counts (the usual case, also if stored as float) are counted
+#exactly with np.bincount in one pass, the statistics and the log spaced
+#histogram then follow from the counts instead of sorting/binning the volume
+def TractHistogram(data1):
+    integer = data1.dtype.kind in 'iu'
+    if data1.dtype.kind=='f' and np.all(np.isfinite(data1)): integer = np.all(np.mod(data1,1)==0)
+    if not integer or np.min(data1)<0 or np.max(data1)>=2**26:
+        positive = data1[data1>0]
+        statistics = np.asarray([np.min(data1), np.average(positive), np.median(positive), np.max(data1)], dtype=np.float64)
+        xbins, ybins = Histogram(data1)
+        return {'statistics':statistics, 'xbins':xbins, 'ybins':ybins}
+    counts = np.bincount(data1.ravel().astype(np.int64))
+    values = np.flatnonzero(counts); counts = counts[values]
+    values = values.astype(data1.dtype) # native type, gives the same bins as Histogram
+    positive = values>0
+    npositive = np.sum(counts[positive]); cumulative = np.cumsum(counts[positive])
+    median = np.mean(np.asarray([CountRank(values[positive], cumulative, (npositive-1)//2),
+                                 CountRank(values[positive], cumulative, npositive//2)])) # as np.median
+    average = np.dot(values[positive].astype(np.float64), counts[positive])/npositive
+    statistics = np.asarray([values[0], average, median, values[-1]], dtype=np.float64)
+    #log spaced bins as in Histogram, counts per bin from the cumulative counts
+    steps = int(np.sqrt(np.prod(data1.shape))) 
+    start = values[positive][0]
+    fin   = values[-1]
+    xbins =  np.unique(np.logspace(np.log10(start),np.log10(fin),steps).astype(int))
+    cumulative = np.concatenate(([0], np.cumsum(counts)))
+    below = cumulative[np.searchsorted(values, xbins, side='left')] # voxels < edge
+    below[-1] = cumulative[np.searchsorted(values, xbins[-1], side='right')] # last bin is closed
+    ybins = np.diff(below)
+    ybins = np.resize (ybins,len(xbins)); ybins[len(ybins)-1]=0
+    return {'statistics':statistics, 'xbins':xbins, 'ybins':ybins, 'values':values, 'counts':counts}
+
+
+#the cached statistics/histogram of FIDfile (or None if not cached or stale),
+#valid if the size matches and either the mtime or the content hash does,
+#on a hash match the new mtime is written back so later runs skip the hash
+def ReadCache(FIDfile, cachefile):
+    if not os.path.isfile(cachefile): return None
+    try:
+        with np.load(cachefile) as npz: cache = dict(npz)
+    except Exception: return None
+    if not all(key in cache for key in ('statistics','xbins','ybins')): return None # incomplete sidecar
+    valid, sha1 = CacheValid(FIDfile, cache)
+    if not valid: return None
+    if sha1 is not None: WriteCache(FIDfile, cachefile, cache, sha1) # only the mtime changed
+    return cache
+
+
+#writes the statistics/histogram of FIDfile to the sidecar cachefile,
+#sha1 is the content hash if already known
+def WriteCache(FIDfile, cachefile, cache, sha1=None):
+    stat = os.stat(FIDfile)
+    if sha1 is None: sha1 = FileHash(FIDfile)
+    cache = dict(cache, size=stat.st_size, mtime=stat.st_mtime, sha1=sha1)
+    try: np.savez(cachefile, **cache)
+    except (IOError, OSError): pass # read only directory, just not cached
+
+
+#threshold at the first minimum of the slope of the (smoothed) log histogram
+def FindThreshold(xbins, ybins):
+    ln_ybins = smooth(np.log(ybins),11)
+    diff1_ln_ybins = np.abs(smooth(np.diff(ln_ybins, n=1),11))
+    i=0;minx=0;miny=diff1_ln_ybins[0]
+    while i<len(diff1_ln_ybins):
+        i+=1
+        if diff1_ln_ybins[i]<=miny: miny=diff1_ln_ybins[i]; minx=i; 
+        else: i=len(diff1_ln_ybins);
+    return xbins[minx]
+
+
+#statistics, histogram and threshold of one fdt_paths file, which is split into
+#a _low and a _high file, the threshold is found automatically unless a fixed
+#one or a percentile (of the nonzero voxels) is given, confirm may change it;
+#statistics and histogram are cached in a sidecar file unless cache is False,
+#write 'high' saves only the _high file, 'mask' only a uint8 _mask file,
+#options are the options of WriteNIFTI (data type, compression);
+#returns a summary row: file, statistics, threshold and voxels above threshold
+def AnalyzeTract(FIDfile, threshold=None, percentile=None, confirm=None, report=print, cache=True, write='both', options=None):
+    options = options or {}
+    img1, data1 = LoadNIFTI(FIDfile)
+    if len(data1.shape) != 3: raise ValueError('Input is not a 3D NIFTI file')
+
+    #names based on first file
+    dirname  = os.path.dirname(FIDfile)
+    basename = os.path.splitext(os.path.basename(FIDfile))[0]; basename = os.path.splitext(basename)[0]
+
+    #statistics and histogram, from the sidecar if the file did not change
+    cachefile = os.path.join(dirname,basename+'_Histogram.npz')
+    histogram = None
+    if cache: histogram = ReadCache(FIDfile, cachefile)
+    if histogram is None:
+        histogram = TractHistogram(data1)
+        if cache: WriteCache(FIDfile, cachefile, histogram)
+    xbins = histogram['xbins']; ybins = histogram['ybins']
+
+    report ("Tract Statistics")
+    min_tract_per_voxel = int(round(histogram['statistics'][0],0))
+    avg_tract_per_voxel = round(histogram['statistics'][1],2)
+    median_tract_per_voxel = round(histogram['statistics'][2],2)
+    max_tract_per_voxel = int(round(histogram['statistics'][3],0))
+    report ("  Minimum number of tracts per voxel =  "+str(min_tract_per_voxel))
+    report ("  Average number of tracts per voxel =  "+str(avg_tract_per_voxel))
+    report ("  Median  number of tracts per voxel =  "+str(median_tract_per_voxel))
+    report ("  Maximum number of tracts per voxel =  "+str(max_tract_per_voxel))
+
+    #write histogram results
+    with open(os.path.join(dirname,basename+'_Histogram.csv'), "w") as csv_file:    
+        np.savetxt(csv_file, np.column_stack((xbins[:-2], ybins[:-2])), fmt='%e', delimiter=',')
+        csv_file.write("\n")  
+
+    #find histogram threshold
+    if threshold is None and percentile is not None:
+        if 'counts' in histogram: threshold = CountPercentile(histogram['values'], histogram['counts'], percentile)
+        else: threshold = np.percentile(data1[data1>0], percentile)
+    if threshold is None:
+        threshold = FindThreshold(xbins, ybins)
+        if confirm is not None: threshold = confirm('  Found threshold at', threshold)
+        else: report ("  Found threshold at "+str(threshold))
+    else: report ("  Using threshold "+str(threshold))
+
+    #apply treshold, one mask, the high part is the only copy (none for 'high'
+    #or 'mask'), the low part is made in place (the dataobj array is private)
+    above = data1>threshold
+    nabove = int(np.count_nonzero(above))
+    outputs = []
+    if write=='mask':
+        outputs.append((above.astype(np.uint8), basename+"_mask.nii.gz"))
+    elif write=='high':
+        data1[~above]=0
+        outputs.append((data1, basename+"_high.nii.gz"))
+    else:
+        data1_high = np.where(above, data1, 0).astype(data1.dtype)
+        data1[above]=0
+        outputs.append((data1, basename+"_low.nii.gz"))
+        outputs.append((data1_high, basename+"_high.nii.gz"))
+    del above
+
+    #save files, compressed concurrently (zlib releases the GIL)
+    save, wait = BackgroundSaver(nqueue=len(outputs), threads=len(outputs))
+    try:
+        for data, filename in outputs:
+            report ("Saving File "+filename)
+            save (data, img1.affine, img1.header, os.path.join(dirname,filename), **options)
+    finally: wait()
+    return [FIDfile, min_tract_per_voxel, avg_tract_per_voxel, median_tract_per_voxel, max_tract_per_voxel,
+            threshold, nabove]
+
+
+#process pool worker, messages are returned instead of printed
+def AnalyzeTract_worker (job):
+    FIDfile, threshold, percentile, cache, write, options = job
+    messages = []; row = None
+    try: row = AnalyzeTract (FIDfile, threshold=threshold, percentile=percentile, report=messages.append, cache=cache, write=write, options=options)
+    except Exception as err: messages.append ("ERROR: "+str(err))
+    return FIDfile, messages, row
+
+
+#headless batch mode, no Tk windows, no threshold confirmation and no keypress at the end
+def batch (argv):
+    parser = argparse.ArgumentParser(prog=Program_name, description='Splits FSL probtrackx fdt_paths files at a threshold into a _low and a _high file')
+    parser.add_argument('files', nargs='+', help='fdt_paths files or glob patterns (e.g. "subj*/fdt_paths.nii.gz")')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-t', '--threshold', type=float, default=None,
+                       help='fixed threshold (default: found automatically from the histogram)')
+    group.add_argument('-p', '--percentile', type=float, default=None,
+                       help='threshold at this percentile (0..100) of the nonzero voxels')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of files processed in parallel (default: %(default)s)')
+    parser.add_argument('-s', '--summary', default='fdt_paths_summary.csv',
+                        help='summary table of thresholds and tract statistics (default: %(default)s)')
+    parser.add_argument('-n', '--no-cache', action='store_true',
+                        help='neither read nor write the _Histogram.npz sidecar with statistics and histogram')
+    parser.add_argument('-w', '--write', choices=['both','high','mask'], default='both',
+                        help='files written: _low and _high (default), only _high, or only a uint8 threshold _mask')
+    AddWriteOptions(parser)
+    args = parser.parse_args(argv)
+    FIDfiles = []
+    for pattern in args.files:
+        matches = sorted(glob.glob(pattern))
+        if len(matches)==0: print ('ERROR: No input file matching '+pattern); sys.exit(2)
+        FIDfiles.extend([os.path.abspath(f) for f in matches])
+    jobs = [(FIDfile, args.threshold, args.percentile, not args.no_cache, args.write, WriteOptions(args)) for FIDfile in FIDfiles]
+    nerrors = 0
+    pool = multiprocessing.Pool(processes=max(1,min(args.jobs,len(jobs))))
+    try:
+        with open(args.summary, "w") as csv_file:
+            csv_file.write("File,Minimum,Average,Median,Maximum,Threshold,Voxels above threshold\n")
+            for FIDfile, messages, row in pool.imap(AnalyzeTract_worker, jobs):
+                print ("Processing "+FIDfile)
+                for msg in messages: print ("   "+msg)
+                if row is None: nerrors+=1; continue
+                csv_file.write('"'+row[0]+'",'+",".join([str(x) for x in row[1:]])+"\n")
+    finally:
+        pool.close(); pool.join()
+    print ("done, "+str(len(jobs)-nerrors)+" of "+str(len(jobs))+" files processed, summary in "+args.summary+"\n")
+    if nerrors>0: sys.exit(1)
+
     
 #general initialization stuff  
 Program_name = os.path.basename(sys.argv[0]); 
 if Program_name.find('.')>0: Program_name = Program_name[:Program_name.find('.')]
 python_version=str(sys.version_info[0])+'.'+str(sys.version_info[1])+'.'+str(sys.version_info[2])
-# sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
-if sys.platform=="win32": os.system("title "+Program_name)
-    
-#TK initialization       
-TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
-TKwindows.update()
-# the following tries to disable showing hidden files/folders under linux
-try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
-except: pass
-try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
-except: pass
-try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
-except: pass
-TKwindows.update()
-
-
-#intercatively choose second input file
-FIDfile = askopenfilename(title='Choose probtack output file (normally called "fdt_paths.nii.gz")', filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
-if FIDfile=="": print ('ERROR: No input file specified'); sys.exit(2)
-FIDfile = os.path.abspath(FIDfile)
-img1 = nib.load(FIDfile)
-data1 = np.asanyarray(img1.dataobj)
-if len(data1.shape) != 3:print ('ERROR: Input is not a 3D NIFTI file'); sys.exit(2) 
-   
-TKwindows.update()
-try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
-except: pass #silent
 
-#names based on first file
-dirname  = os.path.dirname(FIDfile)
-basename = os.path.splitext(os.path.basename(FIDfile))[0]; basename = os.path.splitext(basename)[0]
-
-#copy data for later use
-data1_low = data1.copy()
-data1_high = data1.copy()
-
-print ("Tract Statistics")
-min_tract_per_voxel = int(round(np.min(data1),0))
-avg_tract_per_voxel = round(np.average(data1[data1>0]),2)
-median_tract_per_voxel = round(np.median(data1[data1>0]),2)
-max_tract_per_voxel = int(round(np.max(data1),0))
-print ("  Minimum number of tracts per voxel = ", min_tract_per_voxel)
-print ("  Average number of tracts per voxel = ", avg_tract_per_voxel)
-print ("  Median  number of tracts per voxel = ", median_tract_per_voxel)
-print ("  Maximum number of tracts per voxel = ", max_tract_per_voxel)
-
-#calculate histogram
-steps = int(np.sqrt(np.prod(data1.shape))) 
-start = np.min(data1[np.nonzero(data1)])
-fin   = np.max(data1)
-#xbins =  np.linspace(start,fin,steps)
-xbins =  np.unique(np.logspace(np.log10(start),np.log10(fin),steps).astype(int))
-ybins, binedges = np.histogram(data1, bins=xbins)
-ybins = np.resize (ybins,len(xbins)); ybins[len(ybins)-1]=0
-
-#write histogram results
-with open(os.path.join(dirname,basename+'_Histogram.csv'), "w") as csv_file:    
-    for i in range(0,xbins.shape[0]-2):     
-        csv_file.write("%e,%e\n" % (xbins[i], ybins[i]))
-    csv_file.write("\n")  
-    
-#find histogram threshold
-ln_ybins = smooth(np.log(ybins),11)
-diff1_ln_ybins = np.abs(smooth(np.diff(ln_ybins, n=1),11))
-i=0;minx=0;miny=diff1_ln_ybins[0]
-while i<len(diff1_ln_ybins):
-    i+=1
-    if diff1_ln_ybins[i]<=miny: miny=diff1_ln_ybins[i]; minx=i; 
-    else: i=len(diff1_ln_ybins);
-threshold=xbins[minx]  
-threshold = InputFloat('  Found threshold at', threshold, 10) 
-  
-'''
-print ("")
-data1 = data1[data1>threshold]
-print ("Reevaluating Tract Statistics")
-min_tract_per_voxel = int(round(np.min(data1),0))
-avg_tract_per_voxel = round(np.average(data1[data1>0]),2)
-median_tract_per_voxel = round(np.median(data1[data1>0]),2)
-max_tract_per_voxel = int(round(np.max(data1),0))
-print ("  Minimum number of tracts per voxel = ", min_tract_per_voxel)
-print ("  Average number of tracts per voxel = ", avg_tract_per_voxel)
-print ("  Median  number of tracts per voxel = ", median_tract_per_voxel)
-print ("  Maximum number of tracts per voxel = ", max_tract_per_voxel)
-'''
-
-#apply treshold
-data1_low[data1_low>threshold]=0
-data1_high[data1_high<=threshold]=0
-
-
-#save files
-affine = img1.affine
-sform = int(img1.header['sform_code'])
-qform = int(img1.header['qform_code'])
-unit_xyz, unit_t = img1.header.get_xyzt_units()
-if unit_xyz == 'unknown': unit_xyz=0
-if unit_t   == 'unknown': unit_t=0
-print ("Saving File "+basename+"_low.nii.gz")
-img_SoS = nib.Nifti1Image(data1_low, affine)
-img_SoS.header.set_xyzt_units(unit_xyz, unit_t)
-img_SoS.set_sform(affine, code=sform)
-img_SoS.set_qform(affine, code=qform)
-img_SoS.header.set_slope_inter(1,0)
-img_SoS.header['cal_max']=np.max(data1_low)
-img_SoS.header['extents']=np.min(data1_low)
-img_SoS.header['regular']=img1.header['regular']
-img_SoS.header['scl_slope']=1
-img_SoS.header['scl_inter']=0
-img_SoS.header['glmax']=np.max(data1_low)
-img_SoS.header['glmin']=np.min(data1_low)
-nib.save(img_SoS, os.path.join(dirname,basename+"_low.nii.gz"))
-print ("Saving File "+basename+"_high.nii.gz")
-img_SoS = nib.Nifti1Image(data1_high, affine)
-img_SoS.header.set_xyzt_units(unit_xyz, unit_t)
-img_SoS.set_sform(affine, code=sform)
-img_SoS.set_qform(affine, code=qform)
-img_SoS.header.set_slope_inter(1,0)
-img_SoS.header['cal_max']=np.max(data1_high)
-img_SoS.header['extents']=np.min(data1_high)
-img_SoS.header['regular']=img1.header['regular']
-img_SoS.header['scl_slope']=1
-img_SoS.header['scl_inter']=0
-img_SoS.header['glmax']=np.max(data1_high)
-img_SoS.header['glmin']=np.min(data1_high)
-nib.save(img_SoS, os.path.join(dirname,basename+"_high.nii.gz"))
-     
-#end
-if sys.platform=="win32": os.system("pause") # windows
-else: 
-    #os.system('read -s -n 1 -p "Press any key to continue...\n"')
-    import termios
-    print("Press any key to continue...")
-    fd = sys.stdin.fileno()
-    oldterm = termios.tcgetattr(fd)
-    newattr = termios.tcgetattr(fd)
-    newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
-    termios.tcsetattr(fd, termios.TCSANOW, newattr)
-    try: result = sys.stdin.read(1)
-    except IOError: pass
-    finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)
+
+if __name__ == '__main__':
+    #command line arguments given: run headless
+    if len(sys.argv)>1: batch (sys.argv[1:]); sys.exit(0)
+
+    TK_installed=True
+    try: from tkFileDialog import askopenfilename # Python 2
+    except: 
+        try: from tkinter.filedialog import askopenfilename; # Python3
+        except: TK_installed=False
+    try: import Tkinter as tk; # Python2
+    except: 
+        try: import tkinter as tk; # Python3
+        except: TK_installed=False
+    if not TK_installed:
+        print ('ERROR: tkinter not installed')
+        print ('       on Linux try "yum install tkinter"')
+        print ('       on MacOS install ActiveTcl from:')
+        print ('       http://www.activestate.com/activetcl/downloads')
+        sys.exit(2)
+
+    # sys.platform = [linux2, win32, cygwin, darwin, os2, os2emx, riscos, atheos, freebsd7, freebsd8]
+    if sys.platform=="win32": os.system("title "+Program_name)
+        
+    #TK initialization       
+    TKwindows = tk.Tk(); TKwindows.withdraw() #hiding tkinter window
+    TKwindows.update()
+    # the following tries to disable showing hidden files/folders under linux
+    try: TKwindows.tk.call('tk_getOpenFile', '-foobarz')
+    except: pass
+    try: TKwindows.tk.call('namespace', 'import', '::tk::dialog::file::')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenBtn', '1')
+    except: pass
+    try: TKwindows.tk.call('set', '::tk::dialog::file::showHiddenVar', '0')
+    except: pass
+    TKwindows.update()
+
+
+    #intercatively choose second input file
+    FIDfile = askopenfilename(title='Choose probtack output file (normally called "fdt_paths.nii.gz")', filetypes=[("NIFTI files",('*.nii','*.nii.gz'))])
+    if FIDfile=="": print ('ERROR: No input file specified'); sys.exit(2)
+    FIDfile = os.path.abspath(FIDfile)
+       
+    TKwindows.update()
+    try: win32gui.SetForegroundWindow(win32console.GetConsoleWindow())
+    except: pass #silent
+
+    try: AnalyzeTract (FIDfile, confirm=lambda caption, threshold: InputFloat(caption, threshold, 10))
+    except ValueError as err: print ('ERROR: '+str(err)); sys.exit(2)
+         
+    #end
+    if sys.platform=="win32": os.system("pause") # windows
+    else: 
+        #os.system('read -s -n 1 -p "Press any key to continue...\n"')
+        import termios
+        print("Press any key to continue...")
+        fd = sys.stdin.fileno()
+        oldterm = termios.tcgetattr(fd)
+        newattr = termios.tcgetattr(fd)
+        newattr[3] = newattr[3] & ~termios.ICANON & ~termios.ECHO
+        termios.tcsetattr(fd, termios.TCSANOW, newattr)
+        try: result = sys.stdin.read(1)
+        except IOError: pass
+        finally: termios.tcsetattr(fd, termios.TCSAFLUSH, oldterm)